@@ -0,0 +1,111 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import tempfile
+from flask import Blueprint, abort, request, send_file, url_for
+from werkzeug.security import safe_join
+from config import ASSETS_DIST_DIR, ASSETS_BUILD_ON_STARTUP, ASSET_MAX_AGE
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip variants are written
+    brotli = None
+
+
+# Fingerprinted static assets. build() copies every file under app/static to
+# ASSETS_DIST_DIR with a content hash in its name (css/style.3f2a9c1d0b4e.css)
+# and writes .gz/.br variants of text assets next to it. Templates link them
+# with asset_url('css/style.css'); since the name changes whenever the content
+# does, they are served with a one-year immutable Cache-Control and browsers
+# never ask for them again.
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), 'static')
+MANIFEST = 'manifest.json'
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.map'}
+
+bp = Blueprint('assets', __name__)
+_manifest: dict[str, str] = {}
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    # Several workers may build at once; readers only ever see complete files
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+
+
+def build(static_dir: str = STATIC_DIR, dist_dir: str = ASSETS_DIST_DIR) -> dict:
+    """Fingerprint and precompress every static file; returns {logical name: hashed name}."""
+    manifest = {}
+    dist_abs = os.path.abspath(dist_dir)
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(root, d)) != dist_abs]
+        for file in files:
+            path = os.path.join(root, file)
+            logical = os.path.relpath(path, static_dir).replace(os.sep, '/')
+            with open(path, 'rb') as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            stem, ext = os.path.splitext(logical)
+            hashed = f"{stem}.{digest}{ext}"
+            manifest[logical] = hashed
+            target = os.path.join(dist_dir, hashed)
+            if os.path.exists(target):
+                continue  # same name means same content
+            if ext in COMPRESSIBLE:
+                _write_atomic(target + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    _write_atomic(target + '.br', brotli.compress(data, quality=11))
+            _write_atomic(target, data)
+    _write_atomic(os.path.join(dist_dir, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+def load_manifest(dist_dir: str = ASSETS_DIST_DIR) -> dict:
+    try:
+        with open(os.path.join(dist_dir, MANIFEST), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def asset_url(filename: str) -> str:
+    """url_for('static', filename=...) replacement that links the fingerprinted copy."""
+    hashed = _manifest.get(filename)
+    if hashed is None:
+        return url_for('static', filename=filename)
+    return url_for('assets.asset', filename=hashed)
+
+
+@bp.get('/assets/<path:filename>')
+def asset(filename: str):
+    path = safe_join(ASSETS_DIST_DIR, filename)
+    if path is None or filename == MANIFEST or not os.path.isfile(path):
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = None
+    accepted = request.accept_encodings
+    for enc, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if accepted[enc] and os.path.isfile(path + suffix):
+            path, encoding = path + suffix, enc
+            break
+    etag = f"{filename}+{encoding}" if encoding else filename
+    response = send_file(path, mimetype=mimetype, max_age=ASSET_MAX_AGE, etag=etag)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_app(app) -> None:
+    global _manifest
+    _manifest = build() if ASSETS_BUILD_ON_STARTUP else load_manifest()
+    app.register_blueprint(bp)
+    app.add_template_global(asset_url)
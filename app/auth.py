@@ -1,42 +1,186 @@
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
 from flask_login import UserMixin
 from werkzeug.security import check_password_hash, generate_password_hash
-from .db import query_one
+from .cache import TTLCache
+from .db import query_one, execute
+from . import invalidation
+from config import (
+    PRINCIPAL_CACHE_SIZE,
+    PRINCIPAL_CACHE_TTL,
+    PASSWORD_HASH_METHOD,
+    PASSWORD_HASH_WORKERS,
+    PASSWORD_HASH_QUEUE,
+    PASSWORD_HASH_TIMEOUT,
+    PASSWORD_HASH_RETRY_AFTER,
+)
+
+
+_USER_SQL = """
+    SELECT u.id, u.username, u.role, u.class_name, t.id AS teacher_id{extra}
+    FROM users u
+    LEFT JOIN teachers t ON t.user_id = u.id
+    WHERE {where}
+"""
+
+# user_id -> (version, User). load_user runs on every request, so the principal
+# is kept in memory; bumping a user's version forces the next lookup to reload.
+_principals = TTLCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
+_versions: dict[str, int] = {}
+# Bumped with every user's version; verify_login looks users up by name, so it
+# cannot read the version of the one it will load before querying
+_forgotten = 0
+
+# scrypt/pbkdf2 are slow by design and purely CPU-bound. hashlib releases the
+# GIL while hashing, so this is not about the interpreter lock: hashes run in a
+# small process pool so a burst of sign-ins occupies at most
+# PASSWORD_HASH_WORKERS cores per app process instead of one per request thread,
+# and the app's own threads stay free to serve pages. Workers + queued jobs are
+# capped; beyond that logins fail fast with 503.
+_hash_executor: ProcessPoolExecutor | None = None
+_hash_executor_pid = None
+_hash_executor_lock = threading.Lock()
+_hash_slots = threading.BoundedSemaphore(max(1, PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE))
+
+
+class HashingBusy(Exception):
+    """The password hashing pool is saturated; the caller should retry later."""
+
+    def __init__(self, message: str, retry_after: int = PASSWORD_HASH_RETRY_AFTER):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _hash_executor, _hash_executor_pid
+    with _hash_executor_lock:
+        # A forked worker must not reuse its parent's pool
+        if _hash_executor is None or _hash_executor_pid != os.getpid():
+            _hash_executor = ProcessPoolExecutor(
+                max_workers=PASSWORD_HASH_WORKERS,
+                # spawn: children must not inherit sockets or locks from a threaded server
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+            _hash_executor_pid = os.getpid()
+        return _hash_executor
+
+
+def _run_hash(fn, *args):
+    global _hash_executor
+    if PASSWORD_HASH_WORKERS <= 0:
+        return fn(*args)
+    if not _hash_slots.acquire(blocking=False):
+        raise HashingBusy('password hashing queue is full')
+    try:
+        future = _executor().submit(fn, *args)
+    except BaseException as e:
+        _hash_slots.release()
+        if isinstance(e, BrokenProcessPool):
+            with _hash_executor_lock:
+                _hash_executor = None
+            raise HashingBusy('password hashing pool restarted') from None
+        raise
+    # The slot is held until the job leaves the pool, not until we stop waiting:
+    # a job we gave up on still occupies a worker or a queue place
+    future.add_done_callback(lambda _: _hash_slots.release())
+    try:
+        return future.result(timeout=PASSWORD_HASH_TIMEOUT)
+    except FutureTimeout:
+        raise HashingBusy(f'password hashing took longer than {PASSWORD_HASH_TIMEOUT}s') from None
+    except BrokenProcessPool:
+        with _hash_executor_lock:
+            _hash_executor = None
+        raise HashingBusy('password hashing pool restarted') from None
+
+
+@functools.cache
+def _current_hash_params() -> str:
+    # Werkzeug expands defaults ("scrypt" -> "scrypt:32768:8:1"); compare against that form
+    return generate_password_hash('', PASSWORD_HASH_METHOD).split('$', 1)[0]
+
+
+def needs_rehash(password_hash: str) -> bool:
+    return password_hash.split('$', 1)[0] != _current_hash_params()
 
 
 class User(UserMixin):
-    def __init__(self, user_id: int, username: str, role: str, class_name: str = None):
+    def __init__(self, user_id: int, username: str, role: str, class_name: str = None, teacher_id: int = None):
         self.id = str(user_id)
         self.username = username
         self.role = role
         self.class_name = class_name
+        self.teacher_id = teacher_id
+
+    @staticmethod
+    def from_row(row) -> 'User':
+        return User(row["id"], row["username"], row["role"], row["class_name"], row.get("teacher_id"))
 
     @staticmethod
     def get(user_id: str):
-        row = query_one(
-            "SELECT id, username, role, class_name FROM users WHERE id=%s",
-            (user_id,),
-        )
+        user_id = str(user_id)
+        version = _versions.get(user_id, 0)
+        cached = _principals.get(user_id, None)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        row = query_one(_USER_SQL.format(extra="", where="u.id=%s"), (user_id,))
         if not row:
             return None
-        return User(row["id"], row["username"], row["role"], row["class_name"])
+        user = User.from_row(row)
+        _principals.set(user_id, (version, user))
+        return user
+
+
+def _forget_user(user_id) -> None:
+    global _forgotten
+    user_id = str(user_id)
+    # Before the version: see verify_login
+    _forgotten += 1
+    _versions[user_id] = _versions.get(user_id, 0) + 1
+    _principals.delete(user_id)
+
+
+def invalidate_user(user_id) -> None:
+    """Call after changing a user's username, role, password or teacher profile."""
+    _forget_user(user_id)
+    invalidation.publish('user', {str(user_id)})
+
+
+invalidation.bus.on('user', _forget_user)
 
 
 def verify_login(username: str, password: str):
+    # Read before the query, as User.get reads the version: see the end
+    forgotten = _forgotten
     row = query_one(
-        "SELECT id, username, role, class_name, password_hash FROM users WHERE username=%s",
+        _USER_SQL.format(extra=", u.password_hash", where="u.username=%s"),
         (username,),
     )
     if not row:
         return None
+    version = _versions.get(str(row["id"]), 0)
     try:
-        if not check_password_hash(row["password_hash"], password):
+        if not _run_hash(check_password_hash, row["password_hash"], password):
             return None
+    except HashingBusy:
+        raise
     except Exception:
         # Stored hash is invalid/legacy. Treat as authentication failure without crashing.
         return None
-    return User(row["id"], row["username"], row["role"], row["class_name"])
+    if needs_rehash(row["password_hash"]):
+        # Upgrade hashes made with old parameters while we still have the plaintext
+        execute("UPDATE users SET password_hash=%s WHERE id=%s", (hash_password(password), row["id"]))
+    user = User.from_row(row)
+    # A fresh login always starts from the current row. If some user was
+    # invalidated since the query, the row may predate that change: leave it to
+    # the next User.get. Otherwise any later invalidation bumps past `version`.
+    if _forgotten == forgotten:
+        _principals.set(user.id, (version, user))
+    return user
 
 
 def hash_password(password: str) -> str:
-    return generate_password_hash(password)
-
+    return _run_hash(generate_password_hash, password, PASSWORD_HASH_METHOD)
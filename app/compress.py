@@ -0,0 +1,146 @@
+import threading
+import time
+import zlib
+from flask import g, request
+from config import COMPRESS_ENABLED, COMPRESS_MIN_SIZE, COMPRESS_LEVEL, COMPRESS_BROTLI_QUALITY
+
+try:
+    import brotli
+except ImportError:  # optional: without it responses are gzip-only
+    brotli = None
+
+
+# Response compression. Rendered pages below COMPRESS_MIN_SIZE bytes are sent
+# as they are (the headers would eat the gain); streamed responses are
+# compressed as they go. Event streams are flushed after every chunk so no event
+# sits in the compressor waiting for more data; other streams (the CSV export
+# yields one row per chunk) let it fill whole blocks, since a sync flush per
+# small chunk costs CPU and several times the output. Responses that already carry a
+# Content-Encoding (precompressed assets) and 304s are left alone.
+
+COMPRESSIBLE = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/event-stream', 'text/javascript',
+    'application/javascript', 'application/json', 'application/xml', 'image/svg+xml',
+}
+
+_lock = threading.Lock()
+_stats = {'responses': 0, 'skipped_small': 0, 'bytes_in': 0, 'bytes_out': 0, 'seconds': 0.0}
+
+
+def _observe(bytes_in: int, bytes_out: int, seconds: float) -> None:
+    with _lock:
+        _stats['responses'] += 1
+        _stats['bytes_in'] += bytes_in
+        _stats['bytes_out'] += bytes_out
+        _stats['seconds'] += seconds
+
+
+def stats() -> dict:
+    with _lock:
+        out = dict(_stats)
+    out['ratio'] = out['bytes_out'] / out['bytes_in'] if out['bytes_in'] else 0.0
+    return out
+
+
+def choose_encoding(accept_encodings) -> str | None:
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == 'br':
+            self._c = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+            self.compress, self._flush, self._finish = self._c.process, self._c.flush, self._c.finish
+        else:
+            # wbits 16+ writes a gzip header and trailer
+            self._c = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self.compress = self._c.compress
+            self._flush = lambda: self._c.flush(zlib.Z_SYNC_FLUSH)
+            self._finish = self._c.flush
+
+    def flush(self) -> bytes:
+        return self._flush()
+
+    def finish(self) -> bytes:
+        return self._finish()
+
+
+def _compress_stream(chunks, encoding: str, flush_each: bool = False):
+    compressor = _Compressor(encoding)
+    bytes_in = bytes_out = 0
+    seconds = 0.0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            started = time.perf_counter()
+            out = compressor.compress(chunk)
+            if flush_each:
+                out += compressor.flush()
+            seconds += time.perf_counter() - started
+            bytes_in += len(chunk)
+            bytes_out += len(out)
+            if out:
+                yield out
+        tail = compressor.finish()
+        bytes_out += len(tail)
+        yield tail
+    finally:
+        _observe(bytes_in, bytes_out, seconds)
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def _should_compress(response) -> bool:
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if request.method == 'HEAD' or response.direct_passthrough:
+        return False
+    if 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE:
+        return False
+    return not response.cache_control.no_transform
+
+
+def compress_response(response):
+    if not _should_compress(response):
+        return response
+    # The representation depends on Accept-Encoding whether or not we compress this one
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding,
+                                             flush_each=response.mimetype == 'text/event-stream')
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            with _lock:
+                _stats['skipped_small'] += 1
+            return response
+        started = time.perf_counter()
+        compressor = _Compressor(encoding)
+        body = compressor.compress(data) + compressor.finish()
+        seconds = time.perf_counter() - started
+        _observe(len(data), len(body), seconds)
+        g._compress_ms = seconds * 1000
+        response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    # Bytes differ per encoding, so a strong validator would be wrong
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app) -> None:
+    """Register last so it runs before the other after_request hooks (Flask runs them in reverse)."""
+    if COMPRESS_ENABLED:
+        app.after_request(compress_response)
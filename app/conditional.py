@@ -0,0 +1,71 @@
+import hashlib
+import os
+from datetime import datetime, timezone
+from flask import Response, g, request, session
+from flask_login import current_user
+
+
+# Conditional GET for list and thread views. A view computes a cheap version
+# stamp for what it is about to show (row counts, MAX(updated_at), newest
+# message id...) and calls not_modified() before running its real queries:
+# when the browser's ETag still matches, the 304 goes out straight away and
+# nothing else runs. Otherwise the ETag is attached to the rendered page.
+
+_SOURCES = [os.path.join(os.path.dirname(__file__), d) for d in ('templates', 'static')]
+
+
+def _build_id() -> str:
+    # A deploy that changes templates or assets (and so the fingerprinted URLs
+    # pages link to) must not be answered with 304s for old pages
+    mtimes = [os.stat(os.path.join(root, f)).st_mtime_ns
+              for src in _SOURCES for root, dirs, files in os.walk(src) if 'dist' not in root.split(os.sep)
+              for f in files]
+    return str(max(mtimes, default=0))
+
+
+BUILD_ID = _build_id()
+
+
+def make_etag(*stamp) -> str:
+    # The page depends on who is looking (the nav shows name, role and class)
+    # and on every query arg (filters, cursors)
+    viewer = None
+    if current_user.is_authenticated:
+        viewer = (current_user.id, current_user.username, current_user.role, current_user.class_name)
+    raw = repr((BUILD_ID, viewer, request.full_path, stamp))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def not_modified(*stamp, last_modified: float = None):
+    """Return a 304 response if the client already has this version, else None.
+
+    stamp: values that change whenever the page would render differently;
+    last_modified: epoch seconds of the newest change, if known.
+    """
+    if request.method != 'GET' or session.get('_flashes'):
+        # Pending flash messages only show up in a fresh render
+        return None
+    g._etag = make_etag(*stamp)
+    g._last_modified = last_modified
+    if request.if_none_match.contains_weak(g._etag):
+        return _add_validators(Response(status=304))
+    return None
+
+
+def _add_validators(response):
+    etag = g.pop('_etag', None)
+    if etag is None or response.status_code not in (200, 304):
+        return response
+    response.set_etag(etag, weak=True)
+    last_modified = g.pop('_last_modified', None)
+    if last_modified:
+        response.last_modified = datetime.fromtimestamp(float(last_modified), timezone.utc)
+    # Always revalidate; the ETag makes that cheap
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response
+
+
+def init_app(app) -> None:
+    app.after_request(_add_validators)
@@ -0,0 +1,94 @@
+from collections import defaultdict
+from . import invalidation
+from .db import execute, query_one, transaction
+
+
+# Feedback counts per (teacher_id, subject_id) for the teacher and admin
+# overviews. Every write that changes a feedback row's moderation_status or
+# is_read (or inserts/deletes one) must call into here inside the same
+# transaction(); rebuild() recomputes everything from the feedback table.
+
+_COLUMNS = ('pending_count', 'approved_count', 'rejected_count', 'read_count', 'unread_count')
+
+_UPSERT_SQL = f"""
+    INSERT INTO feedback_counters (teacher_id, subject_id, {', '.join(_COLUMNS)})
+    VALUES (%s, %s, {', '.join(['%s'] * len(_COLUMNS))})
+    ON DUPLICATE KEY UPDATE {', '.join(f'{c} = {c} + VALUES({c})' for c in _COLUMNS)}
+"""
+
+
+def _add(deltas: dict, status: str, is_read, n: int) -> None:
+    deltas[f'{status}_count'] += n
+    if status == 'approved':
+        deltas['read_count' if is_read else 'unread_count'] += n
+
+
+def apply(changes) -> None:
+    """Apply counter changes.
+
+    changes: iterable of (teacher_id, subject_id, moderation_status, is_read, n);
+    n is negative for rows leaving that state.
+    """
+    per_key = defaultdict(lambda: dict.fromkeys(_COLUMNS, 0))
+    for teacher_id, subject_id, status, is_read, n in changes:
+        _add(per_key[(teacher_id, subject_id)], status, is_read, n)
+    for (teacher_id, subject_id), deltas in per_key.items():
+        if any(deltas.values()):
+            execute(_UPSERT_SQL, (teacher_id, subject_id, *(deltas[c] for c in _COLUMNS)))
+
+
+def record_insert(teacher_id: int, subject_id: int, status: str = 'pending', is_read: int = 0) -> None:
+    apply([(teacher_id, subject_id, status, is_read, 1)])
+
+
+def record_change(before: dict, moderation_status: str = None, is_read: int = None) -> None:
+    """before: the feedback row (teacher_id, subject_id, moderation_status, is_read) prior to the UPDATE."""
+    after_status = moderation_status if moderation_status is not None else before['moderation_status']
+    after_read = is_read if is_read is not None else before['is_read']
+    apply([
+        (before['teacher_id'], before['subject_id'], before['moderation_status'], before['is_read'], -1),
+        (before['teacher_id'], before['subject_id'], after_status, after_read, 1),
+    ])
+
+
+def record_delete(before: dict) -> None:
+    apply([(before['teacher_id'], before['subject_id'], before['moderation_status'], before['is_read'], -1)])
+
+
+def rebuild(chunk_size: int = 100) -> int:
+    """Recompute all counters from feedback, one range of teacher ids per transaction.
+
+    Returns the number of counter rows written.
+    """
+    bounds = query_one("SELECT MIN(id) AS lo, MAX(id) AS hi FROM teachers")
+    if not bounds or bounds['lo'] is None:
+        return 0
+    written = 0
+    for lo in range(bounds['lo'], bounds['hi'] + 1, chunk_size):
+        hi = lo + chunk_size - 1
+        with transaction():
+            execute("DELETE FROM feedback_counters WHERE teacher_id BETWEEN %s AND %s", (lo, hi))
+            execute(
+                """
+                INSERT INTO feedback_counters (teacher_id, subject_id, pending_count, approved_count,
+                                               rejected_count, read_count, unread_count)
+                SELECT teacher_id, subject_id,
+                       SUM(moderation_status = 'pending'),
+                       SUM(moderation_status = 'approved'),
+                       SUM(moderation_status = 'rejected'),
+                       SUM(moderation_status = 'approved' AND is_read = 1),
+                       SUM(moderation_status = 'approved' AND is_read = 0)
+                FROM feedback
+                WHERE teacher_id BETWEEN %s AND %s
+                GROUP BY teacher_id, subject_id
+                """,
+                (lo, hi),
+            )
+            row = query_one(
+                "SELECT COUNT(*) AS n FROM feedback_counters WHERE teacher_id BETWEEN %s AND %s", (lo, hi)
+            )
+            written += row['n']
+    # Scripts run without the app's commit listener: tell the running app
+    # processes themselves, or they keep serving cached counts
+    invalidation.publish('table', {'feedback_counters'})
+    return written
@@ -1,20 +1,419 @@
+import bisect
+import itertools
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
 import mysql.connector
-from mysql.connector import pooling
-from config import DB_CONFIG
+from mysql.connector import errorcode
+from flask import g, has_app_context, has_request_context, request, session
+from config import (
+    DB_CONFIG,
+    DB_REPLICAS,
+    DB_REPLICA_MAX_LAG,
+    DB_REPLICA_CHECK_INTERVAL,
+    DB_READ_YOUR_WRITES_WINDOW,
+    DB_POOL_MIN_SIZE,
+    DB_POOL_MAX_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_POOL_MAX_WAITERS,
+    DB_POOL_IDLE_TIMEOUT,
+    DB_POOL_RESET_SESSION,
+    DB_POOL_RETRY_AFTER,
+    DB_PREPARED_STATEMENTS,
+    DB_PREPARED_CACHE_SIZE,
+    DB_ITER_BATCH_SIZE,
+    DB_SLOW_QUERY_MS,
+    DB_NPLUS1_THRESHOLD,
+    QUERY_CACHE_ENABLED,
+    QUERY_CACHE_SIZE,
+    QUERY_CACHE_TTL,
+)
+from .cache import TTLCache, TableVersions
+
+
+# Upper bounds (seconds) of the checkout wait-time histogram buckets
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, float('inf'))
+
+_local = threading.local()
+
+sql_log = logging.getLogger('bzz.sql')
+slow_query_log = logging.getLogger('bzz.slow_query')
+
+_SQL_LITERALS = re.compile(r"'(?:[^'\\]|\\.)*'|\b\d+(?:\.\d+)?\b|%s")
+_SQL_IN_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+
+# Opt-in result cache for query_one/query_all, tagged by the tables a query reads
+query_cache = TTLCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+# Bumped with every invalidation; derived caches (rendered fragments) key on these
+table_versions = TableVersions()
+# Called with the set of tables after every commit that wrote to them
+commit_listeners: list = []
+
+_READ_TABLES = re.compile(r"\b(?:FROM|JOIN)\s+`?(\w+)", re.IGNORECASE)
+_WRITE_TABLE = re.compile(
+    r"^\s*(?:INSERT(?:\s+IGNORE)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+IGNORE)?|DELETE\s+FROM)\s+`?(\w+)",
+    re.IGNORECASE,
+)
+# Rows that ON DELETE CASCADE / SET NULL change behind our back (see sql/)
+_FK_CHILDREN = {
+    'users': ('teachers', 'feedback', 'feedback_messages'),
+    'teachers': ('teacher_subjects', 'teacher_classes', 'feedback', 'feedback_counters'),
+    'subjects': ('teacher_subjects', 'feedback_categories', 'feedback', 'feedback_counters'),
+    'feedback_categories': ('feedback',),
+    'feedback': ('feedback_messages',),
+}
+
+
+class PoolExhausted(Exception):
+    """No connection could be checked out within the wait budget."""
+
+    def __init__(self, message: str, retry_after: int = DB_POOL_RETRY_AFTER):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PooledConnection:
+    """Wraps a raw connection; close() hands it back to the pool instead of closing it."""
+
+    def __init__(self, pool: 'ConnectionPool', raw):
+        self._pool = pool
+        self._raw = raw
+        self.idle_since = time.monotonic()
+        # SQL text -> cursor holding a server-side prepared statement, LRU order
+        self._statements: OrderedDict = OrderedDict()
+        self._statements_conn_id = None
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def execute_prepared(self, sql: str, params: tuple = ()):
+        """Run sql as a cached server-side prepared statement and return its cursor.
+
+        The cursor stays owned by the cache; callers fetch from it but never close it.
+        """
+        # A reconnect gives us a new server session without our statements
+        if self._raw.connection_id != self._statements_conn_id:
+            self.forget_statements()
+            self._statements_conn_id = self._raw.connection_id
+        entry = self._statements.get(sql)
+        if entry is not None:
+            self._statements.move_to_end(sql)
+            key, cur = entry
+            try:
+                cur.execute(key, params)
+                return cur
+            except mysql.connector.Error as e:
+                if e.errno != errorcode.ER_UNKNOWN_STMT_HANDLER:
+                    raise
+                del self._statements[sql]
+        cur = self._raw.cursor(prepared=True, dictionary=True)
+        # The connector only skips re-preparing when handed the very same str object
+        self._statements[sql] = (sql, cur)
+        if len(self._statements) > DB_PREPARED_CACHE_SIZE:
+            _, (_, evicted) = self._statements.popitem(last=False)
+            try:
+                evicted.close()
+            except Exception:
+                pass
+        cur.execute(sql, params)
+        return cur
+
+    def forget_statements(self) -> None:
+        # The server already dropped them (reset/reconnect); just lose the handles
+        self._statements.clear()
+
+    def close(self) -> None:
+        self._pool.release(self)
+
+    def discard(self) -> None:
+        # Drop a connection that is in an unknown state (e.g. unread results)
+        self._pool.release(self, discard=True)
+
+
+class ConnectionPool:
+    """Elastic connection pool with a bounded wait queue.
+
+    Grows on demand up to max_size, shrinks back to min_size once connections
+    sit idle for longer than idle_timeout. Callers that cannot get a connection
+    wait up to `timeout` seconds; if max_waiters callers are already queued the
+    checkout fails immediately instead.
+    """
+
+    def __init__(self, min_size: int, max_size: int, timeout: float, max_waiters: int,
+                 idle_timeout: float, reset_session: bool = True, connect=None, **conn_kwargs):
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.timeout = timeout
+        self.max_waiters = max_waiters
+        self.idle_timeout = idle_timeout
+        self.reset_session = reset_session
+        self._connect = connect or mysql.connector.connect
+        self._conn_kwargs = conn_kwargs
+        self._lock = threading.Condition()
+        self._idle: deque[PooledConnection] = deque()
+        self._size = 0  # open connections, idle + in use
+        self._waiters = 0
+        self._wait_counts = [0] * len(WAIT_BUCKETS)
+        self._wait_sum = 0.0
+        self._timeouts = 0
+        self._rejected = 0
+        self._closed = False
+
+    def fill(self) -> None:
+        """Open connections until min_size is reached."""
+        while True:
+            with self._lock:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = PooledConnection(self, self._connect(**self._conn_kwargs))
+            except Exception:
+                with self._lock:
+                    self._size -= 1
+                    self._lock.notify()
+                raise
+            with self._lock:
+                self._idle.append(conn)
+                self._lock.notify()
+
+    def get_connection(self) -> PooledConnection:
+        started = time.monotonic()
+        deadline = started + self.timeout
+        with self._lock:
+            self._evict_idle()
+            while not self._idle and self._size >= self.max_size:
+                if self._waiters >= self.max_waiters:
+                    self._rejected += 1
+                    raise PoolExhausted('connection pool wait queue is full')
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    self._observe_wait(time.monotonic() - started)
+                    raise PoolExhausted(f'no connection available after {self.timeout}s')
+                self._waiters += 1
+                try:
+                    self._lock.wait(remaining)
+                finally:
+                    self._waiters -= 1
+            self._observe_wait(time.monotonic() - started)
+            if self._idle:
+                # LIFO keeps the hot connections busy so the cold ones can age out
+                conn = self._idle.pop()
+            else:
+                conn = None
+                self._size += 1
+
+        if conn is None:
+            try:
+                return PooledConnection(self, self._connect(**self._conn_kwargs))
+            except Exception:
+                with self._lock:
+                    self._size -= 1
+                    self._lock.notify()
+                raise
+
+        try:
+            if not conn._raw.is_connected():
+                conn._raw.reconnect()
+        except Exception:
+            self._drop(conn)
+            raise
+        return conn
+
+    def release(self, conn: PooledConnection, discard: bool = False) -> None:
+        if not discard:
+            try:
+                if self.reset_session:
+                    conn._raw.reset_session()
+                    conn.forget_statements()
+                elif conn._raw.in_transaction:
+                    conn._raw.rollback()
+            except Exception:
+                discard = True
+        if discard or self._closed:
+            self._drop(conn)
+            return
+        conn.idle_since = time.monotonic()
+        with self._lock:
+            self._idle.append(conn)
+            self._lock.notify()
+
+    def close(self) -> None:
+        """Close the idle connections now and the checked-out ones when they come back."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, deque()
+            self._size -= len(idle)
+        for conn in idle:
+            try:
+                conn._raw.close()
+            except Exception:
+                pass
+
+    def _drop(self, conn: PooledConnection) -> None:
+        try:
+            conn._raw.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._size -= 1
+            self._lock.notify()
+
+    def _evict_idle(self) -> None:
+        # Called with the lock held; oldest idle connections sit at the left end
+        now = time.monotonic()
+        while (self._idle and self._size > self.min_size
+               and now - self._idle[0].idle_since > self.idle_timeout):
+            conn = self._idle.popleft()
+            self._size -= 1
+            try:
+                conn._raw.close()
+            except Exception:
+                pass
+
+    def _observe_wait(self, seconds: float) -> None:
+        self._wait_counts[bisect.bisect_left(WAIT_BUCKETS, seconds)] += 1
+        self._wait_sum += seconds
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'waiters': self._waiters,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'timeouts': self._timeouts,
+                'rejected': self._rejected,
+                'wait_seconds_sum': self._wait_sum,
+                'wait_histogram': dict(zip(WAIT_BUCKETS, self._wait_counts)),
+            }
+
+
+class Replica:
+    """A read replica's pool plus the health state used to route reads to it."""
+
+    def __init__(self, name: str, pool: ConnectionPool):
+        self.name = name
+        self.pool = pool
+        self.healthy = True
+        self.lag = None
+        self.checked_at = 0.0
+        self._checking = threading.Lock()
+
+    def refresh(self) -> None:
+        """Re-check replication lag if the last check is older than the interval."""
+        if time.monotonic() - self.checked_at < DB_REPLICA_CHECK_INTERVAL:
+            return
+        # One thread checks; the others keep routing on the previous verdict
+        if not self._checking.acquire(blocking=False):
+            return
+        try:
+            self.lag = self._measure_lag()
+            self.healthy = self.lag is not None and self.lag <= DB_REPLICA_MAX_LAG
+        except Exception:
+            self.lag = None
+            self.healthy = False
+        finally:
+            self.checked_at = time.monotonic()
+            self._checking.release()
+
+    def _measure_lag(self):
+        conn = self.pool.get_connection()
+        try:
+            cur = conn.cursor(dictionary=True, buffered=True)
+            try:
+                cur.execute("SHOW REPLICA STATUS")
+            except mysql.connector.Error:
+                cur.execute("SHOW SLAVE STATUS")  # MySQL < 8.0.22
+            row = cur.fetchone()
+            cur.close()
+        finally:
+            conn.close()
+        if not row:
+            return 0  # not replicating from anywhere, nothing to lag behind
+        # NULL while the replication SQL thread is stopped
+        return row.get('Seconds_Behind_Source', row.get('Seconds_Behind_Master'))
+
+
+def _new_pool(cfg: dict) -> ConnectionPool:
+    return ConnectionPool(
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        timeout=DB_POOL_TIMEOUT,
+        max_waiters=DB_POOL_MAX_WAITERS,
+        idle_timeout=DB_POOL_IDLE_TIMEOUT,
+        reset_session=DB_POOL_RESET_SESSION,
+        # Statements outside transaction() commit on their own, so a request's
+        # connection never sits in an open read snapshot (or holds metadata
+        # locks) between statements; transaction() starts one explicitly
+        autocommit=True,
+        **cfg,
+    )
 
 
 class MySQLPool:
-    _pool: pooling.MySQLConnectionPool | None = None
+    _pool: ConnectionPool | None = None
+    _replicas: list[Replica] = []
+    _next_replica = itertools.count()
+    # Pools inherited across fork(); see reset_after_fork
+    _inherited: list = []
+    _init_lock = threading.Lock()
 
     @classmethod
     def init_pool(cls) -> None:
+        """Open the pools and their min_size connections; otherwise done by the first checkout."""
+        with cls._init_lock:
+            if cls._pool is None:
+                cls._open()
+
+    @classmethod
+    def _open(cls) -> None:
         if cls._pool is None:
-            cls._pool = pooling.MySQLConnectionPool(
-                pool_name="bzz_pool",
-                pool_size=5,
-                pool_reset_session=True,
-                **DB_CONFIG,
-            )
+            cls._pool = _new_pool(DB_CONFIG)
+            cls._pool.fill()
+            cls._replicas = []
+            for cfg in DB_REPLICAS:
+                replica = Replica(f"{cfg['host']}:{cfg['port']}", _new_pool(cfg))
+                try:
+                    replica.pool.fill()
+                except Exception:
+                    # Keep serving from the primary; the health check retries later
+                    replica.healthy = False
+                    replica.checked_at = time.monotonic()
+                cls._replicas.append(replica)
+
+    @classmethod
+    def close(cls) -> None:
+        """Close every pool, e.g. in the gunicorn master before it forks workers."""
+        with cls._init_lock:
+            pools = [cls._pool] + [r.pool for r in cls._replicas] if cls._pool else []
+            cls._pool, cls._replicas = None, []
+        for pool in pools:
+            pool.close()
+
+    @classmethod
+    def reset_after_fork(cls) -> None:
+        """Runs in a forked child: forget the parent's pools without touching them.
+
+        The child's copies share sockets with the parent, so using or closing
+        them would corrupt the parent's sessions. They are kept referenced so
+        nothing closes them on garbage collection; the child opens its own
+        pools on first use.
+        """
+        global _local
+        if cls._pool is not None:
+            cls._inherited.append((cls._pool, cls._replicas))
+        cls._pool, cls._replicas = None, []
+        # Locks may have been held by parent threads that do not exist here
+        cls._init_lock = threading.Lock()
+        _local = threading.local()
 
     @classmethod
     def get_connection(cls):
@@ -22,40 +421,352 @@ class MySQLPool:
             cls.init_pool()
         return cls._pool.get_connection()
 
+    @classmethod
+    def get_replica(cls) -> Replica | None:
+        """Next healthy replica in round-robin order, or None to read from the primary."""
+        if cls._pool is None:
+            cls.init_pool()
+        for _ in range(len(cls._replicas)):
+            replica = cls._replicas[next(cls._next_replica) % len(cls._replicas)]
+            replica.refresh()
+            if replica.healthy:
+                return replica
+        return None
+
+    @classmethod
+    def stats(cls) -> dict:
+        if cls._pool is None:
+            return {}
+        stats = cls._pool.stats()
+        stats['replicas'] = [
+            {'name': r.name, 'healthy': r.healthy, 'lag': r.lag, **r.pool.stats()}
+            for r in cls._replicas
+        ]
+        return stats
+
 
-def query_one(sql: str, params: tuple = ()):  # returns single row as dict
-    conn = MySQLPool.get_connection()
+# Any fork (gunicorn --preload, multiprocessing) gets fresh pools in the child
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=MySQLPool.reset_after_fork)
+
+
+def _scope():
+    # Request-bound state lives on flask.g; scripts and tests get one per thread
+    return g if has_app_context() else _local
+
+
+def _pinned_to_primary(state) -> bool:
+    # Read-your-writes: a user who just wrote must not read from a lagging replica
+    if getattr(state, '_db_tx_depth', 0):
+        return True
+    if has_request_context():
+        if g.get('_db_wrote'):
+            return True
+        return session.get('_db_primary_until', 0) > time.time()
+    return False
+
+
+def _note_write() -> None:
+    if has_request_context():
+        g._db_wrote = True
+        if MySQLPool._replicas:
+            session['_db_primary_until'] = time.time() + DB_READ_YOUR_WRITES_WINDOW
+
+
+@contextmanager
+def _connection(readonly: bool = False):
+    """Yield the connection statements should run on.
+
+    Inside an app context the first statement checks out a connection that is
+    kept on flask.g until teardown; an open transaction() pins one as well.
+    Anything else borrows a connection for the single statement. Reads go to
+    a healthy replica when one is configured, unless read-your-writes pins the
+    caller to the primary.
+    """
+    state = _scope()
+    attr, checkout = '_db_conn', MySQLPool.get_connection
+    if readonly and MySQLPool._replicas and not _pinned_to_primary(state):
+        if getattr(state, '_db_replica_conn', None) is not None:
+            attr = '_db_replica_conn'
+        else:
+            replica = MySQLPool.get_replica()
+            if replica is not None:
+                attr, checkout = '_db_replica_conn', replica.pool.get_connection
+    conn = getattr(state, attr, None)
+    if conn is not None:
+        yield conn
+        return
+    conn = checkout()
+    if has_app_context():
+        setattr(g, attr, conn)
+        yield conn
+        return
     try:
-        cur = conn.cursor(dictionary=True)
-        cur.execute(sql, params)
-        row = cur.fetchone()
-        cur.close()
-        return row
+        yield conn
     finally:
         conn.close()
 
 
-def query_all(sql: str, params: tuple = ()):  # returns list of dicts
-    conn = MySQLPool.get_connection()
+def close_connection(exc=None) -> None:
+    """Teardown hook: give the request's connections back to their pools."""
+    g.pop('_db_tx_depth', None)
+    g.pop('_db_dirty', None)
+    for attr in ('_db_conn', '_db_replica_conn'):
+        conn = g.pop(attr, None)
+        if conn is not None:
+            conn.close()
+
+
+@contextmanager
+def transaction():
+    """Group writes into one commit; roll everything back if the block raises.
+
+    Nested blocks join the outermost one.
+    """
+    state = _scope()
+    owned = getattr(state, '_db_conn', None) is None
+    if owned:
+        state._db_conn = MySQLPool.get_connection()
+    conn = state._db_conn
+    depth = getattr(state, '_db_tx_depth', 0)
+    state._db_tx_depth = depth + 1
+    if depth == 0:
+        state._db_dirty = set()
+    committed = False
+    try:
+        if depth == 0:
+            conn.start_transaction()
+        yield conn
+        if depth == 0:
+            conn.commit()
+            committed = True
+    except BaseException:
+        if depth == 0:
+            conn.rollback()
+        raise
+    finally:
+        state._db_tx_depth = depth
+        # Outside an app context nobody tears the connection down for us
+        if owned and not has_app_context():
+            state._db_conn = None
+            conn.close()
+    if committed:
+        # Only now can other readers see the new rows
+        _committed(state._db_dirty)
+
+
+def tables_read(sql: str) -> set:
+    return {t.lower() for t in _READ_TABLES.findall(sql)}
+
+
+def tables_written(sql: str) -> set:
+    """Tables a write statement can change, including FK cascades of a DELETE."""
+    m = _WRITE_TABLE.match(sql)
+    if not m:
+        return set()
+    tables = {m.group(1).lower()}
+    if sql.lstrip()[:6].upper() == 'DELETE':
+        pending = list(tables)
+        while pending:
+            for child in _FK_CHILDREN.get(pending.pop(), ()):
+                if child not in tables:
+                    tables.add(child)
+                    pending.append(child)
+    return tables
+
+
+def invalidate_tables(tables) -> None:
+    """Drop this process's cached results for tables; see commit_listeners for the others."""
+    # Versions first: a query that read before this write either sees them moved
+    # when it stores its result (_cache_fill) or is stored early enough to be dropped here
+    table_versions.bump(tables)
+    for table in tables:
+        query_cache.invalidate_tag(table)
+
+
+def mark_written(tables) -> None:
+    """Treat tables as written, now or when the current transaction commits.
+
+    For writes that change what is derived from a table without touching it,
+    e.g. renaming a user who is a teacher changes the teacher list.
+    """
+    state = _scope()
+    if getattr(state, '_db_tx_depth', 0):
+        state._db_dirty |= set(tables)
+    else:
+        _committed(set(tables))
+
+
+def _committed(tables) -> None:
+    if not tables:
+        return
+    invalidate_tables(tables)
+    for listener in commit_listeners:
+        listener(tables)
+
+
+def _cache_key(sql: str, params: tuple, cache_ttl):
+    # Inside a transaction we may see our own uncommitted rows; never cache those
+    if cache_ttl is None or not QUERY_CACHE_ENABLED or getattr(_scope(), '_db_tx_depth', 0):
+        return None
+    return (sql, tuple(params))
+
+
+def _cache_fill(key, value, tables: tuple, versions: tuple, ttl) -> None:
+    # versions were taken before the query ran; if one of its tables was written
+    # since, the result may predate that write and must not be cached
+    query_cache.set(key, value, tags=tables, ttl=ttl, unless=lambda: table_versions.get(tables) != versions)
+
+
+def normalize_sql(sql: str) -> str:
+    """Statement shape: literals and placeholders become ?, whitespace collapsed."""
+    shape = _SQL_LITERALS.sub('?', ' '.join(sql.split()))
+    return _SQL_IN_LISTS.sub('(...)', shape)
+
+
+def _record(sql: str, started: float, rows: int) -> None:
+    ms = (time.perf_counter() - started) * 1000
+    shape = normalize_sql(sql)
+    route = request.endpoint if has_request_context() else None
+    if has_app_context():
+        stats = g.get('_db_stats')
+        if stats is None:
+            stats = g._db_stats = {'count': 0, 'ms': 0.0, 'shapes': Counter()}
+        stats['count'] += 1
+        stats['ms'] += ms
+        stats['shapes'][shape] += 1
+    if sql_log.isEnabledFor(logging.DEBUG):
+        sql_log.debug(f"SQL {ms:.1f}ms rows={rows} route={route} {shape}")
+    if ms >= DB_SLOW_QUERY_MS:
+        slow_query_log.warning('slow query', extra={'fields': {'ms': round(ms, 1), 'rows': rows, 'route': route, 'sql': shape}})
+
+
+def request_db_stats() -> dict:
+    """Query count, total DB time and N+1 suspects for the current request."""
+    stats = g.get('_db_stats') or {'count': 0, 'ms': 0.0, 'shapes': Counter()}
+    return {
+        'count': stats['count'],
+        'ms': stats['ms'],
+        # The same statement shape over and over usually means a query in a loop
+        'repeated': [(shape, n) for shape, n in stats['shapes'].items() if n >= DB_NPLUS1_THRESHOLD],
+    }
+
+
+@contextmanager
+def _cursor(conn, sql: str, params: tuple, buffered: bool = False):
+    if DB_PREPARED_STATEMENTS:
+        cur = conn.execute_prepared(sql, params)
+        try:
+            yield cur
+        finally:
+            # Cached cursors are reused, so leave no unread rows behind
+            if cur.with_rows:
+                cur.fetchall()
+        return
+    cur = conn.cursor(dictionary=True, buffered=buffered)
     try:
-        cur = conn.cursor(dictionary=True)
         cur.execute(sql, params)
-        rows = cur.fetchall()
-        cur.close()
-        return rows
+        yield cur
     finally:
-        conn.close()
+        cur.close()
 
 
-def execute(sql: str, params: tuple = ()) -> int:  # returns lastrowid
-    conn = MySQLPool.get_connection()
+def query_one(sql: str, params: tuple = (), cache_ttl: float | None = None):  # returns single row as dict
+    key = _cache_key(sql, params, cache_ttl)
+    if key is not None:
+        hit = query_cache.get(key, None)
+        if hit is not None:
+            return dict(hit[0]) if hit[0] else hit[0]
+        tables = tuple(tables_read(sql))
+        versions = table_versions.get(tables)
+    # Cached results are read from the primary so a lagging replica cannot pin stale rows
+    with _connection(readonly=key is None) as conn:
+        started = time.perf_counter()
+        with _cursor(conn, sql, params, buffered=True) as cur:
+            row = cur.fetchone()
+    _record(sql, started, 1 if row else 0)
+    if key is not None:
+        _cache_fill(key, (row,), tables, versions, cache_ttl)
+        return dict(row) if row else row
+    return row
+
+
+def query_all(sql: str, params: tuple = (), cache_ttl: float | None = None):  # returns list of dicts
+    key = _cache_key(sql, params, cache_ttl)
+    if key is not None:
+        hit = query_cache.get(key, None)
+        if hit is not None:
+            return [dict(r) for r in hit[0]]
+        tables = tuple(tables_read(sql))
+        versions = table_versions.get(tables)
+    with _connection(readonly=key is None) as conn:
+        started = time.perf_counter()
+        with _cursor(conn, sql, params) as cur:
+            rows = cur.fetchall()
+    _record(sql, started, len(rows))
+    if key is not None:
+        # Callers get copies so nobody can mutate the cached rows
+        _cache_fill(key, (rows,), tables, versions, cache_ttl)
+        return [dict(r) for r in rows]
+    return rows
+
+
+def query_iter(sql: str, params: tuple = (), batch_size: int = DB_ITER_BATCH_SIZE):
+    """Stream rows as dicts without materialising the result set.
+
+    Runs on an unbuffered cursor, so the server streams the result and only
+    batch_size rows are held at a time. The connection is dedicated to the
+    iterator (an unread result blocks it for anything else) and goes back to
+    the pool once the generator is exhausted or closed.
+    """
+    replica = None
+    if MySQLPool._replicas and not _pinned_to_primary(_scope()):
+        replica = MySQLPool.get_replica()
+    conn = replica.pool.get_connection() if replica else MySQLPool.get_connection()
+    finished = False
+    started = time.perf_counter()
+    count = 0
     try:
-        cur = conn.cursor()
+        cur = conn.cursor(dictionary=True, buffered=False)
         cur.execute(sql, params)
-        conn.commit()
-        last_id = cur.lastrowid
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            count += len(rows)
+            yield from rows
         cur.close()
-        return last_id
+        finished = True
     finally:
-        conn.close()
+        _record(sql, started, count)
+        if finished:
+            conn.close()
+        else:
+            # Closed early: draining the rest of a large result would cost more
+            # than opening a fresh connection later
+            conn.discard()
+
+
+def execute(sql: str, params: tuple = ()) -> int:  # returns lastrowid
+    return _execute(sql, params)[0]
+
+
+def execute_rowcount(sql: str, params: tuple = ()) -> int:  # returns affected rows
+    return _execute(sql, params)[1]
+
 
+def _execute(sql: str, params: tuple) -> tuple:
+    _note_write()
+    state = _scope()
+    in_tx = getattr(state, '_db_tx_depth', 0)
+    with _connection() as conn:
+        started = time.perf_counter()
+        # Outside transaction() the connection is in autocommit mode
+        with _cursor(conn, sql, params) as cur:
+            last_id, rowcount = cur.lastrowid, cur.rowcount
+    _record(sql, started, rowcount)
+    if in_tx:
+        state._db_dirty |= tables_written(sql)
+    else:
+        _committed(tables_written(sql))
+    return last_id, rowcount
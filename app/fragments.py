@@ -0,0 +1,69 @@
+from flask import g, has_app_context
+from jinja2 import nodes
+from jinja2.ext import Extension
+from .cache import TTLCache
+from .db import table_versions
+from config import FRAGMENT_CACHE_ENABLED, FRAGMENT_CACHE_SIZE, FRAGMENT_CACHE_TTL
+
+
+# Cached template fragments:
+#
+#   {% cache 'dashboard-teachers', student_class, depends=['teachers', 'teacher_classes'] %}
+#     ...
+#   {% endcache %}
+#
+# The rendered block is stored under its name, the other key values and the
+# versions of the `depends` tables as they were when the request started, so
+# the first write to any of those tables makes the entry unreachable (and LRU
+# eviction reclaims it). Taking the versions before the view queries anything
+# means a block is never stored under versions newer than its data. Everything
+# the block shows must either be in the key or come from a listed table.
+#
+# Data only the block needs can be loaded inside it, through a callable the
+# view passes in, so a cached block costs no query at all:
+#
+#   {% cache 'teacher-subjects', teacher_id, depends=[...] %}
+#     {% set subjects = load_subjects() %} ...
+
+fragment_cache = TTLCache(FRAGMENT_CACHE_SIZE, FRAGMENT_CACHE_TTL)
+
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [parser.parse_expression()]
+        depends = nodes.List([])
+        while parser.stream.skip_if('comma'):
+            if parser.stream.current.test('name:depends') and parser.stream.look().test('assign'):
+                next(parser.stream)
+                next(parser.stream)
+                depends = parser.parse_expression()
+            else:
+                key.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_render', [nodes.List(key), depends]), [], [], body
+        ).set_lineno(lineno)
+
+    def _render(self, key, depends, caller):
+        if not FRAGMENT_CACHE_ENABLED:
+            return caller()
+        started = g.get('_fragment_versions') if has_app_context() else None
+        versions = table_versions.get(depends) if started is None else tuple(started.get(t, 0) for t in depends)
+        cache_key = (tuple(key), tuple(depends), versions)
+        html = fragment_cache.get(cache_key, None)
+        if html is None:
+            html = caller()
+            fragment_cache.set(cache_key, html)
+        return html
+
+
+def _capture_versions():
+    g._fragment_versions = table_versions.snapshot()
+
+
+def init_app(app) -> None:
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.before_request(_capture_versions)
@@ -0,0 +1,281 @@
+import logging
+import os
+import socket
+import threading
+import time
+from collections import deque
+from flask import g, has_app_context
+from .db import commit_listeners, execute, invalidate_tables, query_all, query_one, transaction
+from config import (
+    INVALIDATION_TRANSPORT,
+    INVALIDATION_POLL_INTERVAL,
+    INVALIDATION_RETENTION,
+    INVALIDATION_GAP_TIMEOUT,
+)
+
+
+# Cross-process cache invalidation. Every cache in this app is per process, so
+# a write handled by one gunicorn worker leaves the others serving stale data
+# until their TTLs run out. The writing process publishes what changed
+# ("table" events for the tables it committed, "user" events from
+# auth.invalidate_user), batched into one message per request, and every other
+# process applies them within about one poll interval, the same way it would
+# apply its own writes.
+#
+# The default transport is an append-only table that each process polls by
+# id high-water mark: one indexed range read per interval, whatever the
+# traffic. LocalTransport is an in-memory stand-in for a single process and
+# for tests.
+
+log = logging.getLogger('bzz.invalidation')
+
+LOG_TABLE = 'cache_invalidations'
+POLL_BATCH = 1000
+# Prune old events about once a minute per process
+PRUNE_EVERY = 60.0
+# A jump of more ids than this is treated as reserved-but-unused, not as in-flight commits
+MAX_GAPS = 100
+
+
+def origin() -> str:
+    # Per call, not per import: a forked worker has a new pid
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class MySQLTransport:
+    """Events are rows of cache_invalidations, read in id order.
+
+    Auto-increment ids are handed out at insert time but become visible at
+    commit, so a poll can see id 11 before id 10 exists for it. Ids skipped
+    that way are looked for again until INVALIDATION_GAP_TIMEOUT passes (a
+    rolled-back insert leaves a gap that never fills).
+    """
+
+    def __init__(self, gap_timeout: float = INVALIDATION_GAP_TIMEOUT, retention: int = INVALIDATION_RETENTION):
+        self.gap_timeout = gap_timeout
+        self.retention = retention
+        self.high_water = None
+        self._gaps: dict[int, float] = {}  # missing id -> give up at
+        self._pruned_at = time.monotonic()
+
+    def publish(self, source: str, events: list) -> None:
+        params = []
+        for kind, name in events:
+            params += [source, kind, name]
+        execute(
+            f"INSERT INTO {LOG_TABLE} (origin, kind, name) VALUES {', '.join(['(%s, %s, %s)'] * len(events))}",
+            tuple(params),
+        )
+
+    def sync(self) -> None:
+        """Start from the current end of the log; older events predate our caches."""
+        with transaction():  # read the primary, a replica may lag behind
+            row = query_one(f"SELECT COALESCE(MAX(id), 0) AS id FROM {LOG_TABLE}")
+        self.high_water = int(row['id'])
+        self._gaps.clear()
+
+    def poll(self) -> list:
+        if self.high_water is None:
+            self.sync()
+            return []
+        now = time.monotonic()
+        self._gaps = {i: until for i, until in self._gaps.items() if until > now}
+        sql = f"SELECT id, origin, kind, name FROM {LOG_TABLE} WHERE id > %s"
+        params = [self.high_water]
+        if self._gaps:
+            sql += f" OR id IN ({', '.join(['%s'] * len(self._gaps))})"
+            params += list(self._gaps)
+        with transaction():
+            rows = query_all(f"{sql} ORDER BY id LIMIT {POLL_BATCH}", tuple(params))
+        events = []
+        for row in rows:
+            if row['id'] > self.high_water:
+                if row['id'] - self.high_water - 1 <= MAX_GAPS:
+                    for missing in range(self.high_water + 1, row['id']):
+                        self._gaps[missing] = now + self.gap_timeout
+                self.high_water = int(row['id'])
+            else:
+                self._gaps.pop(row['id'], None)
+            events.append((row['origin'], row['kind'], row['name']))
+        if now - self._pruned_at >= PRUNE_EVERY:
+            self._pruned_at = now
+            self.prune()
+        return events
+
+    def prune(self) -> None:
+        execute(
+            f"DELETE FROM {LOG_TABLE} WHERE created_at < NOW(6) - INTERVAL %s SECOND LIMIT {POLL_BATCH}",
+            (self.retention,),
+        )
+
+
+class LocalHub:
+    """Fan-out point for LocalTransports: what one publishes, all of them receive."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queues: list[deque] = []
+
+    def subscribe(self) -> deque:
+        queue = deque()
+        with self._lock:
+            self._queues.append(queue)
+        return queue
+
+    def publish(self, source: str, events: list) -> None:
+        with self._lock:
+            for queue in self._queues:
+                queue.extend((source, kind, name) for kind, name in events)
+
+
+_local_hub = LocalHub()
+
+
+class LocalTransport:
+    def __init__(self, hub: LocalHub = _local_hub):
+        self.hub = hub
+        self._queue = hub.subscribe()
+
+    def publish(self, source: str, events: list) -> None:
+        self.hub.publish(source, events)
+
+    def sync(self) -> None:
+        self._queue.clear()
+
+    def poll(self) -> list:
+        events = []
+        while self._queue:
+            events.append(self._queue.popleft())
+        return events
+
+
+class InvalidationBus:
+    def __init__(self, transport, poll_interval: float = INVALIDATION_POLL_INTERVAL, source=origin):
+        self.transport = transport
+        self.poll_interval = poll_interval
+        self.source = source
+        self.handlers: dict[str, callable] = {}
+        self.applied = 0
+        self.publish_errors = 0
+        self._lock = threading.Lock()
+        self._poller = None
+        self._poller_pid = None
+        self._synced = False
+
+    def on(self, kind: str, handler) -> None:
+        """Register handler(name) for events of kind published by other processes."""
+        self.handlers[kind] = handler
+
+    def publish(self, kind: str, names) -> None:
+        """Tell the other processes; the caller has already invalidated its own caches."""
+        events = [(kind, str(name)) for name in sorted(names, key=str)]
+        if not events:
+            return
+        try:
+            self.transport.publish(self.source(), events)
+        except Exception:
+            # Our write went through; the others catch up when their TTLs expire
+            self.publish_errors += 1
+            log.exception("could not publish invalidations %s", events)
+
+    def poll_once(self) -> int:
+        """Apply pending events from other processes; returns how many were applied."""
+        me = self.source()
+        pending = {}
+        for source, kind, name in self.transport.poll():
+            if source != me:
+                pending.setdefault(kind, set()).add(name)
+        applied = 0
+        for kind, names in pending.items():
+            handler = self.handlers.get(kind)
+            if handler is None:
+                log.warning("no handler for invalidation kind %r", kind)
+                continue
+            for name in names:
+                handler(name)
+                applied += 1
+        self.applied += applied
+        return applied
+
+    def sync(self) -> None:
+        """Skip everything published so far; call before filling any cache."""
+        self.transport.sync()
+        self._synced = True
+
+    def ensure_synced(self) -> None:
+        """sync() unless already done, e.g. by the gunicorn master before forking this worker.
+
+        A forked worker keeps the parent's position and replays from there: its
+        caches were filled in the parent, so nothing published since may be skipped.
+        """
+        if not self._synced:
+            self.sync()
+
+    def ensure_started(self) -> None:
+        """Start this process's poller if it is not running (cheap; called per request)."""
+        if self._poller_pid == os.getpid() and self._poller.is_alive():
+            return
+        with self._lock:
+            if self._poller_pid == os.getpid() and self._poller.is_alive():
+                return
+            # Sync before serving so nothing published after our caches were filled is skipped
+            try:
+                self.ensure_synced()
+            except Exception:
+                log.exception("invalidation bus sync failed; the poller retries")
+            self._poller = threading.Thread(target=self._poll_loop, name='invalidation-bus', daemon=True)
+            self._poller.start()
+            self._poller_pid = os.getpid()
+
+    def _poll_loop(self) -> None:
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.poll_once()
+            except Exception:
+                log.exception("invalidation bus poll failed")
+
+    def stats(self) -> dict:
+        return {'applied': self.applied, 'publish_errors': self.publish_errors}
+
+
+def _transport():
+    if INVALIDATION_TRANSPORT == 'local':
+        return LocalTransport()
+    if INVALIDATION_TRANSPORT == 'mysql':
+        return MySQLTransport()
+    raise ValueError(f"unknown INVALIDATION_TRANSPORT {INVALIDATION_TRANSPORT!r}")
+
+
+bus = InvalidationBus(_transport())
+bus.on('table', lambda name: invalidate_tables({name}))
+
+
+def publish(kind: str, names) -> None:
+    """Queue events for the other processes; a request sends its events once, at teardown."""
+    names = set(names)
+    if not names:
+        return
+    if not has_app_context():
+        bus.publish(kind, names)
+        return
+    pending = g.setdefault('_invalidations', {})
+    pending.setdefault(kind, set()).update(names)
+
+
+def _publish_tables(tables) -> None:
+    # Writing the log itself must not publish another event
+    publish('table', set(tables) - {LOG_TABLE})
+
+
+def _flush(exc=None) -> None:
+    for kind, names in g.pop('_invalidations', {}).items():
+        bus.publish(kind, names)
+
+
+def init_app(app) -> None:
+    if _publish_tables not in commit_listeners:
+        commit_listeners.append(_publish_tables)
+    app.before_request(bus.ensure_started)
+    # Registered after close_connection, so it runs first and can still use the request's connection
+    app.teardown_appcontext(_flush)
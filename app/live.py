@@ -0,0 +1,124 @@
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from .db import query_all
+from config import LIVE_POLL_INTERVAL, LIVE_MAX_STREAMS
+
+
+# Live feedback threads. Open SSE streams wait on a Condition instead of
+# querying: messages posted in this process wake them immediately through
+# publish(), and a single poller thread per process asks the database for the
+# newest message id of every watched thread, which catches messages posted by
+# other workers. Streams only query when there is something new to fetch, and
+# never hold a connection while they wait. They do hold a worker thread, so at
+# most LIVE_MAX_STREAMS are open per process (see StreamSlots).
+
+log = logging.getLogger('bzz.live')
+
+_MESSAGES_SQL = """
+    SELECT fm.id, fm.message, fm.created_at,
+           CASE WHEN u.role = 'teacher' THEN CONCAT(u.username, ' (Teacher)') ELSE 'Student' END AS sender_name
+    FROM feedback_messages fm
+    JOIN users u ON u.id = fm.sender_user_id
+    WHERE fm.feedback_id=%s AND fm.id > %s
+    ORDER BY fm.id ASC
+"""
+
+
+def messages_after(feedback_id: int, after_id: int = 0) -> list:
+    """Messages of a thread with id > after_id, oldest first. Students stay anonymous."""
+    return query_all(_MESSAGES_SQL, (feedback_id, after_id))
+
+
+class ThreadWatcher:
+    def __init__(self, poll_interval: float):
+        self.poll_interval = poll_interval
+        self._cond = threading.Condition()
+        self._latest: dict[int, int] = {}  # feedback_id -> newest message id seen
+        self._watchers: Counter = Counter()  # feedback_id -> open streams
+        self._poller = None
+
+    def publish(self, feedback_id: int, message_id: int) -> None:
+        with self._cond:
+            # Unwatched threads are not remembered: nothing would ever drop them again
+            if feedback_id in self._watchers and message_id > self._latest.get(feedback_id, 0):
+                self._latest[feedback_id] = message_id
+                self._cond.notify_all()
+
+    @contextmanager
+    def watch(self, feedback_id: int):
+        with self._cond:
+            self._watchers[feedback_id] += 1
+            if self._poller is None or not self._poller.is_alive():
+                self._poller = threading.Thread(target=self._poll_loop, name='thread-watcher', daemon=True)
+                self._poller.start()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._watchers[feedback_id] -= 1
+                if self._watchers[feedback_id] <= 0:
+                    del self._watchers[feedback_id]
+                    self._latest.pop(feedback_id, None)
+
+    def wait(self, feedback_id: int, last_id: int, timeout: float) -> int:
+        """Block until the thread has a message newer than last_id, or timeout.
+
+        Returns the newest message id known for the thread (<= last_id on timeout).
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._latest.get(feedback_id, 0) > last_id, timeout)
+            return self._latest.get(feedback_id, 0)
+
+    def _poll_loop(self) -> None:
+        while True:
+            time.sleep(self.poll_interval)
+            with self._cond:
+                watched = list(self._watchers)
+            if not watched:
+                continue
+            try:
+                rows = query_all(
+                    f"""
+                    SELECT feedback_id, MAX(id) AS last_id FROM feedback_messages
+                    WHERE feedback_id IN ({', '.join(['%s'] * len(watched))})
+                    GROUP BY feedback_id
+                    """,
+                    tuple(watched),
+                )
+            except Exception:
+                log.exception("thread watcher poll failed")
+                continue
+            for row in rows:
+                self.publish(row['feedback_id'], row['last_id'])
+
+
+class StreamSlots:
+    """Non-blocking cap on the streams open in this process."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.rejected = 0
+        self._open = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        with self._lock:
+            if self._open >= self.limit:
+                self.rejected += 1
+                return False
+            self._open += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self._open -= 1
+
+    def stats(self) -> dict:
+        return {'open': self._open, 'limit': self.limit, 'rejected': self.rejected}
+
+
+watcher = ThreadWatcher(LIVE_POLL_INTERVAL)
+stream_slots = StreamSlots(LIVE_MAX_STREAMS)
@@ -0,0 +1,260 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from flask import current_app, g, request
+from flask.logging import default_handler
+from .db import request_db_stats, slow_query_log
+from config import (
+    LOG_DIR,
+    LOG_LEVEL,
+    LOG_FORMAT,
+    LOG_QUEUE_SIZE,
+    LOG_MAX_BYTES,
+    LOG_BACKUP_COUNT,
+    LOG_SAMPLE_RATES,
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, one process per log file
+    fcntl = None
+
+
+# Logging off the request path. Loggers only put records on a bounded queue;
+# one listener thread per process formats them and writes the files. When the
+# queue is full records are dropped and counted rather than making requests
+# wait for the disk. Each request produces one structured "request" record,
+# and endpoints listed in LOG_SAMPLE_RATES log only that fraction of their
+# successful requests (errors and slow requests are always logged).
+#
+# Every gunicorn worker appends to the same files; rotation takes an flock on
+# a sidecar .lock file, and a process that finds the file rotated under it
+# reopens it instead of writing on into the backup.
+
+SLOW_REQUEST_MS = 1000
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; structured fields come from extra={'fields': {...}}."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        out.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            out['exc'] = self.formatException(record.exc_info)
+        return json.dumps(out, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """The classic line format with structured fields appended as key=value."""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s [%(name)s] %(message)s')
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        line = super().formatMessage(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += ' ' + ' '.join(f'{k}={v}' for k, v in fields.items())
+        return line
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Never blocks the caller: a record that does not fit in the queue is counted and dropped."""
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting happens on the listener thread; the record stays in this process
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LockedRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler that several processes can append to and rotate safely."""
+
+    def __init__(self, filename: str, **kwargs):
+        super().__init__(filename, delay=True, **kwargs)
+        self._lock_fd = None
+        self._lock_pid = None
+
+    def _lockfile(self) -> int:
+        # flock is per open file, and a forked child shares its parent's: open our own
+        if self._lock_pid != os.getpid():
+            self._lock_fd = os.open(self.baseFilename + '.lock', os.O_CREAT | os.O_RDWR, 0o644)
+            self._lock_pid = os.getpid()
+        return self._lock_fd
+
+    def _reopen_if_rotated(self) -> None:
+        if self.stream is None:
+            return
+        try:
+            current = os.stat(self.baseFilename).st_ino
+        except FileNotFoundError:
+            current = None
+        if current != os.fstat(self.stream.fileno()).st_ino:
+            self.stream.close()
+            self.stream = None
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if fcntl is None:
+            super().emit(record)
+            return
+        fd = self._lockfile()
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            self._reopen_if_rotated()
+            super().emit(record)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def parse_sample_rates(spec: str) -> dict:
+    """'routes.feedback_messages=0.1,static=0' -> {endpoint: fraction of requests logged}."""
+    rates = {}
+    for item in spec.split(','):
+        endpoint, sep, rate = item.strip().partition('=')
+        if sep:
+            rates[endpoint.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+_sample_rates = parse_sample_rates(LOG_SAMPLE_RATES)
+_sampled_out = 0
+_queue: queue.Queue | None = None
+_queue_handler: DroppingQueueHandler | None = None
+_listener: QueueListener | None = None
+_listener_lock = threading.Lock()
+_stats_lock = threading.Lock()
+
+
+def sample_rate(endpoint: str | None, status: int, duration_ms: float) -> float:
+    """Fraction of requests like this one that are logged."""
+    if status >= 400 or duration_ms >= SLOW_REQUEST_MS:
+        return 1.0
+    return _sample_rates.get(endpoint, 1.0)
+
+
+def stats() -> dict:
+    return {
+        'queued': _queue.qsize() if _queue is not None else 0,
+        'dropped': _queue_handler.dropped if _queue_handler is not None else 0,
+        'sampled_out': _sampled_out,
+    }
+
+
+def _file_handler(name: str, level: int, formatter: logging.Formatter) -> logging.Handler:
+    handler = LockedRotatingFileHandler(
+        os.path.join(LOG_DIR, name), maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+    )
+    handler.setLevel(level)
+    handler.setFormatter(formatter)
+    return handler
+
+
+def _start_listener(handlers) -> None:
+    global _queue, _listener
+    _queue = queue.Queue(LOG_QUEUE_SIZE)
+    _queue_handler.queue = _queue
+    _listener = QueueListener(_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def _after_fork() -> None:
+    # The listener thread did not survive the fork, and locks may have been held by other threads
+    global _stats_lock
+    _stats_lock = threading.Lock()
+    if _listener is not None:
+        _start_listener(_listener.handlers)
+
+
+def _setup_handlers() -> None:
+    global _queue_handler
+    with _listener_lock:
+        if _queue_handler is not None:
+            return
+        os.makedirs(LOG_DIR, exist_ok=True)
+        level = getattr(logging, LOG_LEVEL.upper(), logging.INFO)
+        formatter = JsonFormatter() if LOG_FORMAT == 'json' else TextFormatter()
+        not_slow = lambda record: record.name != slow_query_log.name
+        info_handler = _file_handler('info.log', level, formatter)
+        info_handler.addFilter(not_slow)
+        error_handler = _file_handler('error.log', logging.ERROR, formatter)
+        error_handler.addFilter(not_slow)
+        # Slow statements get their own file so they are not buried in info.log
+        slow_handler = _file_handler('slow_query.log', logging.WARNING, formatter)
+        slow_handler.addFilter(logging.Filter(slow_query_log.name))
+
+        _queue_handler = DroppingQueueHandler(None)
+        _start_listener((info_handler, error_handler, slow_handler))
+        atexit.register(lambda: _listener.stop())
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=_after_fork)
+
+        # Every logger of this app outside Flask's is under "bzz" (slow queries,
+        # invalidation, live threads, warm-up): one handler on the parent serves them all
+        bzz = logging.getLogger('bzz')
+        bzz.addHandler(_queue_handler)
+        bzz.setLevel(level)
+        # Slow statements are written whatever LOG_LEVEL says
+        slow_query_log.setLevel(logging.WARNING)
+
+
+def _log_request_start():
+    g._start_time = time.perf_counter()
+
+
+def _log_request_end(response):
+    global _sampled_out
+    duration_ms = (time.perf_counter() - g.get('_start_time', time.perf_counter())) * 1000
+    rate = sample_rate(request.endpoint, response.status_code, duration_ms)
+    if rate < 1.0 and random.random() >= rate:
+        with _stats_lock:
+            _sampled_out += 1
+        return response
+    db = request_db_stats()
+    logger = current_app.logger
+    logger.info('request', extra={'fields': {
+        'method': request.method,
+        'path': request.path,
+        'query': request.query_string.decode('latin-1'),
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'duration_ms': round(duration_ms, 1),
+        'db_queries': db['count'],
+        'db_ms': round(db['ms'], 1),
+        'compress_ms': round(g.get('_compress_ms', 0), 1),
+        'sample_rate': rate,
+    }})
+    for shape, count in db['repeated']:
+        logger.warning('N+1 candidate', extra={'fields': {'endpoint': request.endpoint, 'count': count, 'sql': shape}})
+    return response
+
+
+def init_app(app) -> None:
+    _setup_handlers()
+    app.logger.setLevel(getattr(logging, LOG_LEVEL.upper(), logging.INFO))
+    # Flask's stderr handler would write on the request thread
+    app.logger.removeHandler(default_handler)
+    if _queue_handler not in app.logger.handlers:
+        app.logger.addHandler(_queue_handler)
+    app.before_request(_log_request_start)
+    app.after_request(_log_request_end)
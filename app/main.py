@@ -1,20 +1,19 @@
-from flask import Flask, request, g
-import logging
-from logging.handlers import RotatingFileHandler
-import os
-import time
+from flask import Flask
 from flask_login import LoginManager
+from werkzeug.exceptions import HTTPException
 from .routes import bp as routes_bp
-from .auth import User
-from .db import MySQLPool
-from config import SECRET_KEY, LOG_DIR, LOG_LEVEL
+from . import assets, compress, conditional, fragments, invalidation, logs, metrics
+from .auth import User, HashingBusy
+from .db import MySQLPool, PoolExhausted, close_connection
+from config import SECRET_KEY
 
 
 def create_app():
     app = Flask(__name__)
     app.config.from_mapping(SECRET_KEY=SECRET_KEY)
-    # init db pool
-    MySQLPool.init_pool()
+    # The db pool opens on first use (or in warmup.warm_up), so importing the app
+    # in a gunicorn master opens no sockets; each request keeps one connection until teardown
+    app.teardown_appcontext(close_connection)
 
     # login manager
     login_manager = LoginManager()
@@ -25,40 +24,35 @@ def create_app():
     def load_user(user_id):
         return User.get(user_id)
     app.register_blueprint(routes_bp)
+    conditional.init_app(app)
+    assets.init_app(app)
+    fragments.init_app(app)
+    invalidation.init_app(app)
 
-    # Logging setup
-    os.makedirs(LOG_DIR, exist_ok=True)
-    app.logger.setLevel(getattr(logging, LOG_LEVEL.upper(), logging.INFO))
-
-    info_handler = RotatingFileHandler(os.path.join(LOG_DIR, 'info.log'), maxBytes=1_000_000, backupCount=5, encoding='utf-8')
-    info_handler.setLevel(getattr(logging, LOG_LEVEL.upper(), logging.INFO))
-    info_formatter = logging.Formatter('%(asctime)s %(levelname)s [%(name)s] %(message)s')
-    info_handler.setFormatter(info_formatter)
-    app.logger.addHandler(info_handler)
+    # Logging setup: records go through a queue to a writer thread, one
+    # structured line per request (see app/logs.py)
+    logs.init_app(app)
+    app.logger.info('App initialized')
+    metrics.init_app(app)
 
-    error_handler = RotatingFileHandler(os.path.join(LOG_DIR, 'error.log'), maxBytes=1_000_000, backupCount=5, encoding='utf-8')
-    error_handler.setLevel(logging.ERROR)
-    error_formatter = logging.Formatter('%(asctime)s %(levelname)s [%(name)s] %(message)s')
-    error_handler.setFormatter(error_formatter)
-    app.logger.addHandler(error_handler)
+    # Registered after the logging and metrics hooks so it runs first and the request line sees its timing
+    compress.init_app(app)
 
-    # Example startup log
-    app.logger.info('App initialized')
+    @app.errorhandler(PoolExhausted)
+    def _shed_load(e):
+        stats = MySQLPool.stats()
+        app.logger.warning(f"DB pool exhausted: {e} in_use={stats.get('in_use')} waiters={stats.get('waiters')}")
+        return ("Service temporarily overloaded, please retry", 503, {'Retry-After': str(e.retry_after)})
 
-    # Per-request logging
-    @app.before_request
-    def _log_request_start():
-        g._start_time = time.time()
-        app.logger.info(f"REQ {request.method} {request.path} args={dict(request.args)}")
+    @app.errorhandler(HashingBusy)
+    def _shed_login_load(e):
+        app.logger.warning(f"Password hashing saturated: {e}")
+        return ("Too many sign-ins right now, please retry", 503, {'Retry-After': str(e.retry_after)})
 
-    @app.after_request
-    def _log_request_end(response):
-        try:
-            duration_ms = int((time.time() - getattr(g, '_start_time', time.time())) * 1000)
-        except Exception:
-            duration_ms = -1
-        app.logger.info(f"RES {request.method} {request.path} status={response.status_code} duration_ms={duration_ms}")
-        return response
+    @app.errorhandler(HTTPException)
+    def _http_error(e):
+        # abort(404), unknown URLs, 405s: answered as they are, not caught as a 500 below
+        return e
 
     @app.errorhandler(Exception)
     def _log_unhandled_error(e):
@@ -0,0 +1,356 @@
+import bisect
+import glob
+import hmac
+import ipaddress
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from flask import Blueprint, Response, g, request
+from . import auth, compress, fragments, logs, refdata
+from .db import MySQLPool, WAIT_BUCKETS, query_cache, request_db_stats
+from .invalidation import bus
+from .live import stream_slots
+from config import METRICS_ENABLED, METRICS_DIR, METRICS_FLUSH_INTERVAL, METRICS_ALLOWED_NETWORKS, METRICS_TOKEN
+
+
+# Prometheus metrics at GET /metrics (text exposition format 0.0.4).
+#
+# Each process counts into its own registry. With several gunicorn workers a
+# scrape reaches just one of them, so every process also writes a snapshot
+# to METRICS_DIR/<pid>.json every METRICS_FLUSH_INTERVAL seconds and /metrics
+# merges all snapshots: counters and histograms are summed over every process
+# that ever wrote one (a restarted worker's counts are not lost), gauges over
+# the processes still alive. When a worker exits, retire() folds its counts
+# into retired.json, so the directory holds one file per live worker plus
+# that one. Clear METRICS_DIR when the server starts (gunicorn.conf.py does
+# both). Without METRICS_DIR only this process is reported.
+#
+# Scrapers authenticate with METRICS_TOKEN when it is set. Without it only
+# direct connections from METRICS_ALLOWED_NETWORKS are answered: behind a
+# reverse proxy every client has the proxy's address, so proxied requests
+# are refused.
+#
+# Cache hit ratios are left to the query: rate(bzz_cache_hits_total) /
+# (rate(bzz_cache_hits_total) + rate(bzz_cache_misses_total)).
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    'bzz_http_requests_total': ('counter', 'HTTP requests by endpoint, method and status.', None),
+    'bzz_http_request_duration_seconds': ('histogram', 'Time until the response object was ready, by endpoint.', REQUEST_BUCKETS),
+    'bzz_db_queries_total': ('counter', 'SQL statements run by requests, by endpoint.', None),
+    'bzz_db_query_seconds_total': ('counter', 'Time spent in SQL statements by requests, by endpoint.', None),
+    'bzz_db_pool_connections': ('gauge', 'Open pool connections by pool and state.', None),
+    'bzz_db_pool_waiters': ('gauge', 'Requests waiting for a pool connection.', None),
+    'bzz_db_pool_timeouts_total': ('counter', 'Checkouts that gave up waiting for a connection.', None),
+    'bzz_db_pool_rejected_total': ('counter', 'Checkouts rejected because the wait queue was full.', None),
+    'bzz_db_pool_wait_seconds': ('histogram', 'Time spent waiting for a pool connection.', WAIT_BUCKETS),
+    'bzz_cache_hits_total': ('counter', 'In-process cache hits by cache.', None),
+    'bzz_cache_misses_total': ('counter', 'In-process cache misses by cache.', None),
+    'bzz_cache_evictions_total': ('counter', 'In-process cache LRU evictions by cache.', None),
+    'bzz_cache_entries': ('gauge', 'Entries held by in-process caches.', None),
+    'bzz_refdata_loads_total': ('counter', 'Reference data snapshots loaded.', None),
+    'bzz_compress_responses_total': ('counter', 'Responses compressed.', None),
+    'bzz_compress_skipped_small_total': ('counter', 'Responses left uncompressed for being small.', None),
+    'bzz_compress_bytes_in_total': ('counter', 'Bytes before compression.', None),
+    'bzz_compress_bytes_out_total': ('counter', 'Bytes after compression.', None),
+    'bzz_compress_seconds_total': ('counter', 'Time spent compressing.', None),
+    'bzz_log_queue_length': ('gauge', 'Log records waiting to be written.', None),
+    'bzz_log_dropped_total': ('counter', 'Log records dropped because the queue was full.', None),
+    'bzz_log_sampled_out_total': ('counter', 'Request log lines skipped by sampling.', None),
+    'bzz_invalidations_applied_total': ('counter', 'Cache invalidations applied from other processes.', None),
+    'bzz_invalidation_publish_errors_total': ('counter', 'Cache invalidations that could not be published.', None),
+    'bzz_live_streams': ('gauge', 'Open live feedback streams.', None),
+    'bzz_live_streams_rejected_total': ('counter', 'Live streams refused with a 503 at LIVE_MAX_STREAMS.', None),
+}
+
+bp = Blueprint('metrics', __name__)
+
+
+class Registry:
+    """Counters and histograms of one process, keyed by (name, sorted label pairs)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: dict = defaultdict(float)
+        self.histograms: dict = {}  # key -> [per-bucket counts, sum]
+
+    def inc(self, name: str, labels: dict, value: float = 1.0) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] += value
+
+    def observe(self, name: str, labels: dict, value: float) -> None:
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = [[0] * len(buckets), 0.0]
+            hist[0][bisect.bisect_left(buckets, value)] += 1
+            hist[1] += value
+
+    def samples(self) -> dict:
+        with self._lock:
+            return {
+                'counters': [[n, dict(l), v] for (n, l), v in self.counters.items()],
+                'histograms': [[n, dict(l), list(h[0]), h[1]] for (n, l), h in self.histograms.items()],
+            }
+
+
+registry = Registry()
+
+
+def _collect() -> dict:
+    """This process's registry plus the stats the other modules keep themselves."""
+    out = registry.samples()
+    out['gauges'] = gauges = []
+    counters, histograms = out['counters'], out['histograms']
+
+    pool_stats = MySQLPool.stats()
+    pools = [('primary', pool_stats)] if pool_stats else []
+    pools += [(r['name'], r) for r in pool_stats.get('replicas', ())]
+    for name, s in pools:
+        gauges.append(['bzz_db_pool_connections', {'pool': name, 'state': 'in_use'}, s['in_use']])
+        gauges.append(['bzz_db_pool_connections', {'pool': name, 'state': 'idle'}, s['idle']])
+        gauges.append(['bzz_db_pool_waiters', {'pool': name}, s['waiters']])
+        counters.append(['bzz_db_pool_timeouts_total', {'pool': name}, s['timeouts']])
+        counters.append(['bzz_db_pool_rejected_total', {'pool': name}, s['rejected']])
+        histograms.append(['bzz_db_pool_wait_seconds', {'pool': name},
+                           [s['wait_histogram'][b] for b in WAIT_BUCKETS], s['wait_seconds_sum']])
+
+    for name, cache in (('query', query_cache), ('principal', auth._principals), ('fragment', fragments.fragment_cache)):
+        s = cache.stats()
+        counters.append(['bzz_cache_hits_total', {'cache': name}, s['hits']])
+        counters.append(['bzz_cache_misses_total', {'cache': name}, s['misses']])
+        counters.append(['bzz_cache_evictions_total', {'cache': name}, s['evictions']])
+        gauges.append(['bzz_cache_entries', {'cache': name}, s['size']])
+    counters.append(['bzz_refdata_loads_total', {}, refdata.stats()['loads']])
+
+    s = compress.stats()
+    counters += [
+        ['bzz_compress_responses_total', {}, s['responses']],
+        ['bzz_compress_skipped_small_total', {}, s['skipped_small']],
+        ['bzz_compress_bytes_in_total', {}, s['bytes_in']],
+        ['bzz_compress_bytes_out_total', {}, s['bytes_out']],
+        ['bzz_compress_seconds_total', {}, s['seconds']],
+    ]
+    s = logs.stats()
+    gauges.append(['bzz_log_queue_length', {}, s['queued']])
+    counters += [['bzz_log_dropped_total', {}, s['dropped']], ['bzz_log_sampled_out_total', {}, s['sampled_out']]]
+    s = bus.stats()
+    counters += [
+        ['bzz_invalidations_applied_total', {}, s['applied']],
+        ['bzz_invalidation_publish_errors_total', {}, s['publish_errors']],
+    ]
+    s = stream_slots.stats()
+    gauges.append(['bzz_live_streams', {}, s['open']])
+    counters.append(['bzz_live_streams_rejected_total', {}, s['rejected']])
+    return out
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+RETIRED = 'retired.json'
+
+
+def _write(metrics_dir: str, name: str, snapshot: dict) -> None:
+    data = json.dumps(snapshot).encode()
+    os.makedirs(metrics_dir, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=metrics_dir, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, os.path.join(metrics_dir, name))
+
+
+def _read(path: str) -> dict | None:
+    try:
+        with open(path, 'rb') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None  # missing, or half-written by a crashed process
+
+
+def flush(metrics_dir: str = METRICS_DIR) -> None:
+    """Write this process's snapshot where the other processes can read it."""
+    _write(metrics_dir, f'{os.getpid()}.json', {'pid': os.getpid(), **_collect()})
+
+
+def retire(pid: int, metrics_dir: str = METRICS_DIR) -> None:
+    """Fold an exited process's counters and histograms into retired.json and drop its file.
+
+    Call from one process at a time (gunicorn's master, in child_exit).
+    """
+    if not metrics_dir:
+        return
+    path = os.path.join(metrics_dir, f'{pid}.json')
+    snapshot = _read(path)
+    if snapshot is not None:
+        snapshots = [snapshot, _read(os.path.join(metrics_dir, RETIRED)) or {'pid': 0, 'counters': [], 'histograms': []}]
+        # Gauges of an exited process count for nothing
+        merged = merge([{**s, 'gauges': []} for s in snapshots])
+        _write(metrics_dir, RETIRED, {
+            'pid': 0,
+            'counters': [[n, dict(l), v] for (n, l), v in merged['counters'].items()],
+            'gauges': [],
+            'histograms': [[n, dict(l), h[0], h[1]] for (n, l), h in merged['histograms'].items()],
+        })
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _snapshots(metrics_dir: str) -> list:
+    if not metrics_dir:
+        return [{'pid': os.getpid(), **_collect()}]
+    flush(metrics_dir)
+    snapshots = (_read(path) for path in glob.glob(os.path.join(metrics_dir, '*.json')))
+    return [s for s in snapshots if s is not None]
+
+
+def merge(snapshots: list) -> dict:
+    """Sum counters and histograms over every snapshot, gauges over live processes."""
+    merged = {'counters': defaultdict(float), 'gauges': defaultdict(float), 'histograms': {}}
+    for snap in snapshots:
+        for name, labels, value in snap['counters']:
+            merged['counters'][(name, tuple(sorted(labels.items())))] += value
+        if snap['gauges'] and (snap['pid'] == os.getpid() or _alive(snap['pid'])):
+            for name, labels, value in snap['gauges']:
+                merged['gauges'][(name, tuple(sorted(labels.items())))] += value
+        for name, labels, counts, total in snap['histograms']:
+            key = (name, tuple(sorted(labels.items())))
+            hist = merged['histograms'].setdefault(key, [[0] * len(counts), 0.0])
+            hist[0] = [a + b for a, b in zip(hist[0], counts)]
+            hist[1] += total
+    return merged
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def render(merged: dict) -> str:
+    by_name = defaultdict(list)
+    for kind in ('counters', 'gauges', 'histograms'):
+        for (name, labels), value in merged[kind].items():
+            by_name[name].append((labels, value))
+    lines = []
+    for name in sorted(by_name):
+        kind, help_text, buckets = METRICS.get(name, ('untyped', '', None))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in sorted(by_name[name]):
+            if kind != 'histogram':
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(buckets, counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(labels + (("le", _number(bound)),))} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(total)}')
+            lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+_allowed = [ipaddress.ip_network(n.strip()) for n in METRICS_ALLOWED_NETWORKS.split(',') if n.strip()]
+
+
+def _authorized() -> bool:
+    if METRICS_TOKEN:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {METRICS_TOKEN}')
+    if 'X-Forwarded-For' in request.headers or 'Forwarded' in request.headers:
+        return False  # remote_addr is the proxy's
+    try:
+        remote = ipaddress.ip_address(request.remote_addr or '')
+    except ValueError:
+        return False
+    return any(remote in network for network in _allowed)
+
+
+@bp.get('/metrics')
+def metrics():
+    if not _authorized():
+        return Response('Not Found', status=404, content_type='text/plain')
+    body = render(merge(_snapshots(METRICS_DIR)))
+    return Response(body, content_type='text/plain; version=0.0.4; charset=utf-8',
+                    headers={'Cache-Control': 'no-store'})
+
+
+class _Flusher:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def ensure_started(self) -> None:
+        if self._pid == os.getpid() or not METRICS_DIR:
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                threading.Thread(target=self._loop, name='metrics-flusher', daemon=True).start()
+                self._pid = os.getpid()
+
+    def _loop(self) -> None:
+        while True:
+            time.sleep(METRICS_FLUSH_INTERVAL)
+            try:
+                flush()
+            except Exception:
+                pass  # the next round retries; a scrape flushes on its own anyway
+
+
+_flusher = _Flusher()
+
+
+def _start_timer():
+    _flusher.ensure_started()
+    g._metrics_start = time.perf_counter()
+
+
+def _observe(response):
+    started = g.get('_metrics_start')
+    if started is None:
+        return response
+    # Unmatched URLs share one label so scanners cannot blow up the series count
+    endpoint = request.endpoint or 'unmatched'
+    registry.observe('bzz_http_request_duration_seconds', {'endpoint': endpoint}, time.perf_counter() - started)
+    registry.inc('bzz_http_requests_total',
+                 {'endpoint': endpoint, 'method': request.method, 'status': str(response.status_code)})
+    db = request_db_stats()
+    if db['count']:
+        registry.inc('bzz_db_queries_total', {'endpoint': endpoint}, db['count'])
+        registry.inc('bzz_db_query_seconds_total', {'endpoint': endpoint}, db['ms'] / 1000)
+    return response
+
+
+def init_app(app) -> None:
+    if not METRICS_ENABLED:
+        return
+    app.register_blueprint(bp)
+    app.before_request(_start_timer)
+    app.after_request(_observe)
@@ -0,0 +1,69 @@
+import base64
+from datetime import datetime
+from .db import query_all
+from config import FEEDBACK_PAGE_SIZE
+
+
+# Keyset pagination over feedback lists ordered newest first by (created_at, id).
+# A cursor is the (created_at, id) of the row at a page boundary, so every page
+# is an index range scan of page_size rows however deep the history goes.
+
+
+def encode_cursor(row) -> str:
+    raw = f"{row['created_at'].isoformat()}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str | None):
+    """(created_at, id) from a cursor token, or None if missing or malformed."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        created_at, row_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class Page:
+    def __init__(self, rows, next_cursor=None, prev_cursor=None):
+        self.rows = rows
+        self.next_cursor = next_cursor  # older rows
+        self.prev_cursor = prev_cursor  # newer rows
+
+
+def fetch_page(sql: str, params: tuple, after: str = None, before: str = None,
+               page_size: int = FEEDBACK_PAGE_SIZE, alias: str = 'f') -> Page:
+    """Run sql (a SELECT over feedback ending in its WHERE clause) one page at a time.
+
+    `after` continues to older rows, `before` goes back to newer ones; both
+    are cursors taken from a previous Page.
+    """
+    after_key, before_key = decode_cursor(after), decode_cursor(before)
+    if before_key:
+        key, cmp, order = before_key, '>', 'ASC'
+    elif after_key:
+        key, cmp, order = after_key, '<', 'DESC'
+    else:
+        key, cmp, order = None, None, 'DESC'
+
+    bound, bound_params = '', ()
+    if key:
+        bound = f"AND ({alias}.created_at {cmp} %s OR ({alias}.created_at = %s AND {alias}.id {cmp} %s))"
+        bound_params = (key[0], key[0], key[1])
+    rows = query_all(
+        f"{sql} {bound} ORDER BY {alias}.created_at {order}, {alias}.id {order} LIMIT %s",
+        tuple(params) + bound_params + (page_size + 1,),
+    )
+    # One extra row tells us whether another page exists in the scan direction
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if not rows:
+        return Page(rows)
+    if before_key:
+        rows.reverse()
+        return Page(rows, next_cursor=encode_cursor(rows[-1]),
+                    prev_cursor=encode_cursor(rows[0]) if has_more else None)
+    return Page(rows, next_cursor=encode_cursor(rows[-1]) if has_more else None,
+                prev_cursor=encode_cursor(rows[0]) if after_key else None)
@@ -0,0 +1,111 @@
+import threading
+import time
+from collections import defaultdict
+from .db import query_all, table_versions, transaction
+from config import REFDATA_TTL
+
+
+# Reference data for the student flow (subjects, global categories, teachers
+# and their subject/class mappings) held in memory as one immutable snapshot.
+# Readers take whatever snapshot is current without locking; when a write bumps
+# the version of any source table (or the TTL runs out, which covers writes made
+# by other processes) the next reader loads a new snapshot and swaps it in.
+#
+# Only the tables the snapshot is about are watched. users and
+# feedback_categories are written all the time (sign-ups, password re-hashes,
+# per-subject categories) without changing anything here: a teacher rename
+# marks `teachers` as written (db.mark_written), and global categories only
+# come from the sql/ scripts, which the TTL covers.
+
+TABLES = ('subjects', 'teachers', 'teacher_subjects', 'teacher_classes')
+
+
+class RefData:
+    def __init__(self, versions: tuple, subjects: dict, categories: tuple, teachers: dict,
+                 teacher_subjects: dict, class_teachers: dict):
+        self.versions = versions
+        self.loaded_at = time.monotonic()
+        self.subjects = subjects                  # subject id -> name
+        self.categories = categories              # global categories, (id, name) by name
+        self.teachers = teachers                  # teacher id -> username, in username order
+        self.teacher_subjects = teacher_subjects  # teacher id -> subject ids, by subject name
+        self.class_teachers = class_teachers      # class name -> teacher ids, by username
+
+    def teachers_for_class(self, class_name: str | None) -> list:
+        """[{id, username}] teaching class_name, or every teacher when class_name is empty."""
+        ids = self.class_teachers.get(class_name, ()) if class_name else self.teachers
+        return [{'id': t, 'username': self.teachers[t]} for t in ids]
+
+    def subjects_for_teacher(self, teacher_id: int) -> list:
+        return [{'id': s, 'name': self.subjects[s]} for s in self.teacher_subjects.get(teacher_id, ())]
+
+    def global_categories(self) -> list:
+        return [{'id': c, 'name': name} for c, name in self.categories]
+
+    def teacher_name(self, teacher_id: int) -> str | None:
+        return self.teachers.get(teacher_id)
+
+
+_snapshot: RefData | None = None
+_load_lock = threading.Lock()
+_loads = 0
+
+
+def _load(versions: tuple) -> RefData:
+    # One transaction: a consistent view of all tables, read from the primary
+    with transaction():
+        subjects = query_all("SELECT id, name FROM subjects ORDER BY name")
+        categories = query_all("SELECT id, name FROM feedback_categories WHERE subject_id IS NULL ORDER BY name")
+        teachers = query_all(
+            "SELECT t.id, u.username FROM teachers t JOIN users u ON u.id = t.user_id ORDER BY u.username"
+        )
+        mappings = query_all("SELECT teacher_id, subject_id FROM teacher_subjects")
+        classes = query_all("SELECT teacher_id, class_name FROM teacher_classes")
+
+    subject_order = {r['id']: i for i, r in enumerate(subjects)}
+    teacher_order = {r['id']: i for i, r in enumerate(teachers)}
+    teacher_subjects = defaultdict(list)
+    for r in mappings:
+        teacher_subjects[r['teacher_id']].append(r['subject_id'])
+    class_teachers = defaultdict(list)
+    for r in classes:
+        if r['teacher_id'] in teacher_order:
+            class_teachers[r['class_name']].append(r['teacher_id'])
+    return RefData(
+        versions,
+        subjects={r['id']: r['name'] for r in subjects},
+        categories=tuple((r['id'], r['name']) for r in categories),
+        teachers={r['id']: r['username'] for r in teachers},
+        teacher_subjects={t: tuple(sorted(ids, key=subject_order.__getitem__)) for t, ids in teacher_subjects.items()},
+        class_teachers={c: tuple(sorted(ids, key=teacher_order.__getitem__)) for c, ids in class_teachers.items()},
+    )
+
+
+def _fresh(snapshot, versions) -> bool:
+    return (snapshot is not None and snapshot.versions == versions
+            and time.monotonic() - snapshot.loaded_at < REFDATA_TTL)
+
+
+def current() -> RefData:
+    """The current snapshot, reloading it first if a source table changed."""
+    global _snapshot, _loads
+    snapshot = _snapshot
+    if _fresh(snapshot, table_versions.get(TABLES)):
+        return snapshot
+    with _load_lock:
+        # Versions are read before loading, so a write that lands mid-load
+        # leaves this snapshot already stale and triggers another reload
+        versions = table_versions.get(TABLES)
+        if not _fresh(_snapshot, versions):
+            _snapshot = _load(versions)
+            _loads += 1
+        return _snapshot
+
+
+def stats() -> dict:
+    snapshot = _snapshot
+    return {
+        'loads': _loads,
+        'teachers': len(snapshot.teachers) if snapshot else 0,
+        'age_seconds': time.monotonic() - snapshot.loaded_at if snapshot else None,
+    }
@@ -1,7 +1,18 @@
-from flask import Blueprint, render_template, redirect, request, url_for, flash, current_app
+import csv
+import io
+import json
+import time
+from flask import Blueprint, Response, render_template, redirect, request, url_for, flash, current_app, stream_with_context, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
-from .auth import verify_login, hash_password
-from .db import query_all, query_one, execute
+from .auth import User, verify_login, hash_password, invalidate_user
+from .db import query_all, query_one, query_iter, execute, execute_rowcount, transaction, mark_written
+from . import counters, refdata
+from .pagination import fetch_page, encode_cursor, decode_cursor
+from .search import search_feedback
+from .live import watcher, stream_slots, messages_after
+from .conditional import not_modified
+from config import (QUERY_CACHE_TTL, MODERATION_BULK_CHUNK_SIZE, SEARCH_MAX_PAGES, LIVE_HEARTBEAT,
+                    LIVE_STREAM_MAX_AGE, LIVE_RETRY_MS)
 
 bp = Blueprint('routes', __name__)
 
@@ -63,10 +74,9 @@ def register():
         current_app.logger.info(f"register student user_id={user_id} username={username} class={class_name}")
 
         # Auto-login after register
-        user_row = query_one('SELECT id, username, role, class_name FROM users WHERE id=%s', (user_id,))
-        if user_row:
-            from .auth import User  # local import to avoid circular at top
-            login_user(User(user_row['id'], user_row['username'], user_row['role'], user_row['class_name']))
+        user = User.get(user_id)
+        if user:
+            login_user(user)
             return redirect(url_for('routes.dashboard'))
 
         flash('Registration complete. Please login.', 'success')
@@ -91,35 +101,13 @@ def dashboard():
     if current_user.role == 'admin':
         return redirect(url_for('routes.admin_feedback'))
     # student flow: choose teacher then subject
-    # Get student's class information
-    student_info = query_one('SELECT class_name FROM users WHERE id=%s', (current_user.id,))
-    student_class = student_info['class_name'] if student_info else None
-    
+    # Student's class comes with the cached principal, the teachers from reference data in memory
+    student_class = current_user.class_name
+    teachers = refdata.current().teachers_for_class(student_class)
     if not student_class:
         # If student has no class assigned, show all teachers (fallback)
-        teachers = query_all(
-            """
-            SELECT t.id, u.username
-            FROM teachers t
-            JOIN users u ON u.id = t.user_id
-            ORDER BY u.username
-            """
-        )
         current_app.logger.warning(f"student {current_user.id} has no class assigned, showing all teachers")
-    else:
-        # Show only teachers that teach the student's class
-        teachers = query_all(
-            """
-            SELECT DISTINCT t.id, u.username
-            FROM teachers t
-            JOIN users u ON u.id = t.user_id
-            JOIN teacher_classes tc ON tc.teacher_id = t.id
-            WHERE tc.class_name = %s
-            ORDER BY u.username
-            """,
-            (student_class,)
-        )
-    
+
     current_app.logger.info(f"view student dashboard user_id={current_user.id} class={student_class} teachers={len(teachers)}")
     return render_template('student_dashboard.html', teachers=teachers, student_class=student_class)
 
@@ -130,7 +118,15 @@ def my_feedback():
     if current_user.role != 'student':
         return redirect(url_for('routes.dashboard'))
 
-    rows = query_all(
+    version = query_one(
+        "SELECT COUNT(*) AS n, UNIX_TIMESTAMP(MAX(updated_at)) AS last_modified FROM feedback WHERE student_id=%s",
+        (int(current_user.id),),
+    )
+    cached = not_modified(version['n'], version['last_modified'], last_modified=version['last_modified'])
+    if cached:
+        return cached
+
+    page = fetch_page(
         """
         SELECT f.id, f.title, f.info, f.is_read, f.moderation_status, f.created_at,
                s.name AS subject_name,
@@ -142,22 +138,39 @@ def my_feedback():
         JOIN users u ON u.id = t.user_id
         LEFT JOIN feedback_categories fc ON fc.id = f.category_id
         WHERE f.student_id=%s
-        ORDER BY f.created_at DESC
         """,
         (int(current_user.id),),
+        after=request.args.get('after'),
+        before=request.args.get('before'),
     )
-    current_app.logger.info(f"view my_feedback user_id={current_user.id} count={len(rows)}")
-    return render_template('my_feedback.html', feedback=rows)
+    # Totals cover all of the student's feedback, not just this page
+    stats = query_one(
+        """
+        SELECT COUNT(*) AS total,
+               COALESCE(SUM(moderation_status = 'approved' AND is_read = 1), 0) AS read_count,
+               COALESCE(SUM(moderation_status = 'pending'), 0) AS pending_count
+        FROM feedback
+        WHERE student_id=%s
+        """,
+        (int(current_user.id),),
+    )
+    current_app.logger.info(f"view my_feedback user_id={current_user.id} count={len(page.rows)}")
+    return render_template('my_feedback.html', feedback=page.rows, page=page, stats=stats)
 
 
 @bp.post('/feedback/<int:feedback_id>/delete')
 @login_required
 def delete_feedback(feedback_id: int):
     # only the student who created it can delete
-    fb = query_one('SELECT id, student_id FROM feedback WHERE id=%s', (feedback_id,))
-    if not fb or fb['student_id'] != int(current_user.id):
-        return redirect(url_for('routes.dashboard'))
-    execute('DELETE FROM feedback WHERE id=%s', (feedback_id,))
+    with transaction():
+        fb = query_one(
+            'SELECT id, student_id, teacher_id, subject_id, moderation_status, is_read FROM feedback WHERE id=%s FOR UPDATE',
+            (feedback_id,),
+        )
+        if not fb or fb['student_id'] != int(current_user.id):
+            return redirect(url_for('routes.dashboard'))
+        execute('DELETE FROM feedback WHERE id=%s', (feedback_id,))
+        counters.record_delete(fb)
     flash('Feedback deleted', 'success')
     current_app.logger.info(f"delete feedback id={feedback_id} by user_id={current_user.id}")
     return redirect(url_for('routes.my_feedback'))
@@ -216,7 +229,8 @@ def edit_feedback(feedback_id: int):
         WHERE subject_id IS NULL OR subject_id = %s 
         ORDER BY name
         """,
-        (fb['subject_id'],)
+        (fb['subject_id'],),
+        cache_ttl=QUERY_CACHE_TTL,
     )
     
     return render_template('edit_feedback.html', feedback=fb, categories=categories)
@@ -225,32 +239,11 @@ def edit_feedback(feedback_id: int):
 @bp.get('/choose-subject/<int:teacher_id>')
 @login_required
 def choose_subject(teacher_id: int):
-    subjects = query_all(
-        """
-        SELECT s.id, s.name
-        FROM teacher_subjects ts
-        JOIN subjects s ON s.id = ts.subject_id
-        WHERE ts.teacher_id = %s
-        ORDER BY s.name
-        """,
-        (teacher_id,),
-    )
-    categories = query_all(
-        "SELECT id, name FROM feedback_categories WHERE subject_id IS NULL ORDER BY name"
-    )
-    
-    # Get teacher's name
-    teacher_info = query_one(
-        """
-        SELECT u.username
-        FROM teachers t
-        JOIN users u ON u.id = t.user_id
-        WHERE t.id = %s
-        """,
-        (teacher_id,),
-    )
-    teacher_name = teacher_info['username'] if teacher_info else 'Unknown Teacher'
-    
+    ref = refdata.current()
+    subjects = ref.subjects_for_teacher(teacher_id)
+    categories = ref.global_categories()
+    teacher_name = ref.teacher_name(teacher_id) or 'Unknown Teacher'
+
     current_app.logger.info(f"choose_subject user_id={current_user.id} teacher_id={teacher_id} subjects={len(subjects)}")
     return render_template('choose_subject.html', teacher_id=teacher_id, teacher_name=teacher_name, subjects=subjects, categories=categories)
 
@@ -268,7 +261,18 @@ def submit_feedback():
 
         # Determine category id based on selection (required)
         if category_id == '__custom__':
-            if custom_category:
+            if not custom_category:
+                flash('Please provide a custom category name', 'error')
+                return redirect(url_for('routes.choose_subject', teacher_id=teacher_id))
+        elif category_id:
+            category_id = int(category_id)
+        else:
+            flash('Please choose a category', 'error')
+            return redirect(url_for('routes.choose_subject', teacher_id=teacher_id))
+
+        # Category upsert and feedback insert share one commit
+        with transaction():
+            if category_id == '__custom__':
                 # upsert category for this subject
                 existing = query_one(
                     "SELECT id FROM feedback_categories WHERE subject_id=%s AND name=%s",
@@ -281,22 +285,15 @@ def submit_feedback():
                         "INSERT INTO feedback_categories (subject_id, name) VALUES (%s, %s)",
                         (subject_id, custom_category),
                     )
-            else:
-                flash('Please provide a custom category name', 'error')
-                return redirect(url_for('routes.choose_subject', teacher_id=teacher_id))
-        elif category_id:
-            category_id = int(category_id)
-        else:
-            flash('Please choose a category', 'error')
-            return redirect(url_for('routes.choose_subject', teacher_id=teacher_id))
 
-        execute(
-            """
-            INSERT INTO feedback (student_id, teacher_id, subject_id, category_id, title, info, moderation_status)
-            VALUES (%s, %s, %s, %s, %s, %s, 'pending')
-            """,
-            (int(current_user.id) if current_user.role == 'student' else None, teacher_id, subject_id, category_id, title, info),
-        )
+            execute(
+                """
+                INSERT INTO feedback (student_id, teacher_id, subject_id, category_id, title, info, moderation_status)
+                VALUES (%s, %s, %s, %s, %s, %s, 'pending')
+                """,
+                (int(current_user.id) if current_user.role == 'student' else None, teacher_id, subject_id, category_id, title, info),
+            )
+            counters.record_insert(teacher_id, subject_id)
         flash('Feedback submitted', 'success')
         current_app.logger.info(f"submit_feedback by user_id={current_user.id} teacher_id={teacher_id} subject_id={subject_id} category_id={category_id}")
         return redirect(url_for('routes.dashboard'))
@@ -312,39 +309,52 @@ def teacher_feedback():
     if current_user.role != 'teacher':
         return redirect(url_for('routes.dashboard'))
 
-    teacher_row = query_one("SELECT id FROM teachers WHERE user_id=%s", (int(current_user.id),))
-    if not teacher_row:
+    teacher_id = current_user.teacher_id
+    if not teacher_id:
         flash('Teacher profile not found', 'error')
         return redirect(url_for('routes.dashboard'))
-    teacher_id = teacher_row['id']
 
     subject_id = request.args.get('subject_id')
 
     # If no subject selected, show subject overview with counts
     if not subject_id:
-        subjects = query_all(
+        # Counts come from feedback_counters: one row per subject instead of a scan over feedback.
+        # Only run when the template's cached block has to be rendered.
+        load_subjects = lambda: query_all(
             """
             SELECT s.id, s.name,
-                   COALESCE(SUM(CASE WHEN f.is_read = 0 THEN 1 ELSE 0 END), 0) AS unread_count,
-                   COALESCE(SUM(CASE WHEN f.is_read = 1 THEN 1 ELSE 0 END), 0) AS read_count,
-                   COALESCE(COUNT(f.id), 0) AS total_count
+                   COALESCE(c.unread_count, 0) AS unread_count,
+                   COALESCE(c.read_count, 0) AS read_count,
+                   COALESCE(c.approved_count, 0) AS total_count
             FROM teacher_subjects ts
             JOIN subjects s ON s.id = ts.subject_id
-            LEFT JOIN feedback f ON f.teacher_id = %s AND f.subject_id = s.id AND f.moderation_status = 'approved'
+            LEFT JOIN feedback_counters c ON c.teacher_id = ts.teacher_id AND c.subject_id = s.id
             WHERE ts.teacher_id = %s
-            GROUP BY s.id, s.name
             ORDER BY s.name
             """,
-            (teacher_id, teacher_id),
+            (teacher_id,),
         )
-        current_app.logger.info(f"view teacher subjects overview user_id={current_user.id} subjects={len(subjects)}")
-        return render_template('teacher_subjects.html', subjects=subjects)
+        current_app.logger.info(f"view teacher subjects overview user_id={current_user.id}")
+        return render_template('teacher_subjects.html', load_subjects=load_subjects)
 
     # Per-subject feedback list
     subject_id = int(subject_id)
     show_unread_only = request.args.get('unread') == '1'
+    # Any change to an approved row moves MAX(updated_at); rows leaving the list change the count
+    version = query_one(
+        """
+        SELECT (SELECT approved_count FROM feedback_counters WHERE teacher_id=%s AND subject_id=%s) AS n,
+               UNIX_TIMESTAMP(MAX(updated_at)) AS last_modified
+        FROM feedback
+        WHERE teacher_id=%s AND subject_id=%s AND moderation_status='approved'
+        """,
+        (teacher_id, subject_id, teacher_id, subject_id),
+    )
+    cached = not_modified(version['n'], version['last_modified'], last_modified=version['last_modified'])
+    if cached:
+        return cached
     where_clause = "WHERE f.teacher_id=%s AND f.subject_id=%s AND f.moderation_status='approved'" + (' AND f.is_read=0' if show_unread_only else '')
-    rows = query_all(
+    page = fetch_page(
         f"""
         SELECT f.id, f.title, f.info, f.is_read, f.created_at,
                s.name AS subject_name,
@@ -353,12 +363,16 @@ def teacher_feedback():
         JOIN subjects s ON s.id = f.subject_id
         LEFT JOIN feedback_categories fc ON fc.id = f.category_id
         {where_clause}
-        ORDER BY f.created_at DESC
         """,
         (teacher_id, subject_id),
+        after=request.args.get('after'),
+        before=request.args.get('before'),
     )
-    current_app.logger.info(f"view teacher_feedback user_id={current_user.id} subject_id={subject_id} unread_only={show_unread_only} count={len(rows)}")
-    return render_template('teacher_feedback.html', feedback=rows, show_unread_only=show_unread_only, subject_id=subject_id)
+    current_app.logger.info(f"view teacher_feedback user_id={current_user.id} subject_id={subject_id} unread_only={show_unread_only} count={len(page.rows)}")
+    # "Mark all read" covers this page and everything older, but nothing that arrives after it was rendered
+    upto = encode_cursor(page.rows[0]) if page.rows else None
+    return render_template('teacher_feedback.html', feedback=page.rows, page=page, show_unread_only=show_unread_only,
+                           subject_id=subject_id, upto=upto)
 
 
 @bp.get('/admin/feedback')
@@ -372,12 +386,12 @@ def admin_feedback():
         subjects = query_all(
             """
             SELECT s.id, s.name,
-                   COALESCE(SUM(CASE WHEN f.moderation_status='pending' THEN 1 ELSE 0 END), 0) AS pending_count,
-                   COALESCE(SUM(CASE WHEN f.moderation_status='approved' THEN 1 ELSE 0 END), 0) AS approved_count,
-                   COALESCE(SUM(CASE WHEN f.moderation_status='rejected' THEN 1 ELSE 0 END), 0) AS rejected_count,
-                   COALESCE(COUNT(f.id), 0) AS total_count
+                   COALESCE(SUM(c.pending_count), 0) AS pending_count,
+                   COALESCE(SUM(c.approved_count), 0) AS approved_count,
+                   COALESCE(SUM(c.rejected_count), 0) AS rejected_count,
+                   COALESCE(SUM(c.pending_count + c.approved_count + c.rejected_count), 0) AS total_count
             FROM subjects s
-            LEFT JOIN feedback f ON f.subject_id = s.id
+            LEFT JOIN feedback_counters c ON c.subject_id = s.id
             GROUP BY s.id, s.name
             ORDER BY s.name
             """
@@ -386,7 +400,20 @@ def admin_feedback():
 
     subject_id = int(subject_id)
     status = request.args.get('status', 'pending')
-    rows = query_all(
+    if status in ('pending', 'approved', 'rejected'):
+        version = query_one(
+            f"""
+            SELECT (SELECT COALESCE(SUM({status}_count), 0) FROM feedback_counters WHERE subject_id=%s) AS n,
+                   UNIX_TIMESTAMP(MAX(updated_at)) AS last_modified
+            FROM feedback
+            WHERE subject_id=%s AND moderation_status=%s
+            """,
+            (subject_id, subject_id, status),
+        )
+        cached = not_modified(version['n'], version['last_modified'], last_modified=version['last_modified'])
+        if cached:
+            return cached
+    page = fetch_page(
         """
         SELECT f.id, f.title, f.info, f.moderation_status, f.created_at,
                s.name AS subject_name,
@@ -396,11 +423,86 @@ def admin_feedback():
         JOIN teachers t ON t.id = f.teacher_id
         JOIN users u_t ON u_t.id = t.user_id
         WHERE f.subject_id=%s AND f.moderation_status=%s
-        ORDER BY f.created_at DESC
         """,
         (subject_id, status),
+        after=request.args.get('after'),
+        before=request.args.get('before'),
     )
-    return render_template('admin_feedback.html', feedback=rows, subject_id=subject_id, status=status)
+    return render_template('admin_feedback.html', feedback=page.rows, page=page, subject_id=subject_id, status=status)
+
+
+@bp.get('/search')
+@login_required
+def search():
+    q = request.args.get('q', '').strip()
+    page_no = max(1, min(request.args.get('page', 1, type=int), SEARCH_MAX_PAGES))
+    hits, has_next = search_feedback(current_user, q, page_no) if q else ([], False)
+    current_app.logger.info(f"search user_id={current_user.id} page={page_no} hits={len(hits)}")
+    return render_template('search.html', q=q, hits=hits, page_no=page_no,
+                           has_next=has_next and page_no < SEARCH_MAX_PAGES)
+
+
+@bp.get('/admin/feedback/export.csv')
+@login_required
+def admin_export_feedback():
+    if current_user.role != 'admin':
+        return redirect(url_for('routes.dashboard'))
+
+    subject_id = request.args.get('subject_id', type=int)
+    status = request.args.get('status')
+    where, params = [], []
+    if subject_id:
+        where.append('f.subject_id=%s')
+        params.append(subject_id)
+    if status in ('pending', 'approved', 'rejected'):
+        where.append('f.moderation_status=%s')
+        params.append(status)
+    sql = f"""
+        SELECT f.id, f.created_at, s.name AS subject_name, u_t.username AS teacher_name,
+               COALESCE(fc.name, '') AS category_name, f.moderation_status, f.is_read, f.title, f.info
+        FROM feedback f
+        JOIN subjects s ON s.id = f.subject_id
+        JOIN teachers t ON t.id = f.teacher_id
+        JOIN users u_t ON u_t.id = t.user_id
+        LEFT JOIN feedback_categories fc ON fc.id = f.category_id
+        {'WHERE ' + ' AND '.join(where) if where else ''}
+        ORDER BY f.id
+    """
+    columns = ['id', 'created_at', 'subject_name', 'teacher_name', 'category_name',
+               'moderation_status', 'is_read', 'title', 'info']
+
+    def generate():
+        # Rows are streamed straight from the cursor, one CSV line at a time
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(columns)
+        for row in query_iter(sql, tuple(params)):
+            writer.writerow([row[c] for c in columns])
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        if buf.tell():
+            yield buf.getvalue()
+
+    current_app.logger.info(f"export feedback user_id={current_user.id} subject_id={subject_id} status={status}")
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv',
+        headers={'Content-Disposition': 'attachment; filename=feedback.csv'},
+    )
+
+
+def _set_moderation_status(feedback_id: int, new_status: str) -> None:
+    # Status and overview counters change together
+    with transaction():
+        fb = query_one(
+            "SELECT teacher_id, subject_id, moderation_status, is_read FROM feedback WHERE id=%s FOR UPDATE",
+            (feedback_id,),
+        )
+        if not fb or fb['moderation_status'] == new_status:
+            return
+        execute("UPDATE feedback SET moderation_status=%s WHERE id=%s", (new_status, feedback_id))
+        counters.record_change(fb, moderation_status=new_status)
 
 
 @bp.post('/admin/feedback/<int:feedback_id>/approve')
@@ -408,7 +510,7 @@ def admin_feedback():
 def admin_approve(feedback_id: int):
     if current_user.role != 'admin':
         return redirect(url_for('routes.dashboard'))
-    execute("UPDATE feedback SET moderation_status='approved' WHERE id=%s", (feedback_id,))
+    _set_moderation_status(feedback_id, 'approved')
     return redirect(request.referrer or url_for('routes.admin_feedback'))
 
 
@@ -417,7 +519,7 @@ def admin_approve(feedback_id: int):
 def admin_reject(feedback_id: int):
     if current_user.role != 'admin':
         return redirect(url_for('routes.dashboard'))
-    execute("UPDATE feedback SET moderation_status='rejected' WHERE id=%s", (feedback_id,))
+    _set_moderation_status(feedback_id, 'rejected')
     return redirect(request.referrer or url_for('routes.admin_feedback'))
 
 
@@ -432,11 +534,110 @@ def admin_change_status(feedback_id: int):
         flash('Invalid status', 'error')
         return redirect(request.referrer or url_for('routes.admin_feedback'))
     
-    execute("UPDATE feedback SET moderation_status=%s WHERE id=%s", (new_status, feedback_id))
+    _set_moderation_status(feedback_id, new_status)
     flash(f'Feedback status changed to {new_status}', 'success')
     return redirect(request.referrer or url_for('routes.admin_feedback'))
 
 
+def _update_status_chunk(ids: list, new_status: str) -> int:
+    """Move one chunk of feedback ids to new_status; returns the rows changed."""
+    placeholders = ', '.join(['%s'] * len(ids))
+    # Lock the rows and learn how the counters shift in one grouped read
+    groups = query_all(
+        f"""
+        SELECT teacher_id, subject_id, moderation_status, is_read, COUNT(*) AS n
+        FROM feedback
+        WHERE id IN ({placeholders}) AND moderation_status != %s
+        GROUP BY teacher_id, subject_id, moderation_status, is_read
+        FOR UPDATE
+        """,
+        (*ids, new_status),
+    )
+    if not groups:
+        return 0
+    changed = execute_rowcount(
+        f"UPDATE feedback SET moderation_status=%s WHERE id IN ({placeholders}) AND moderation_status != %s",
+        (new_status, *ids, new_status),
+    )
+    counters.apply(
+        change
+        for g in groups
+        for change in (
+            (g['teacher_id'], g['subject_id'], g['moderation_status'], g['is_read'], -g['n']),
+            (g['teacher_id'], g['subject_id'], new_status, g['is_read'], g['n']),
+        )
+    )
+    return changed
+
+
+def _bulk_set_moderation_status(new_status: str, ids: list = None, subject_id: int = None,
+                                from_status: str = None) -> int:
+    """Set new_status on the given ids, or on every feedback in subject_id with from_status.
+
+    Runs as one transaction of chunked UPDATEs; returns the number of rows changed.
+    """
+    changed = 0
+    with transaction():
+        if ids is not None:
+            for i in range(0, len(ids), MODERATION_BULK_CHUNK_SIZE):
+                changed += _update_status_chunk(ids[i:i + MODERATION_BULK_CHUNK_SIZE], new_status)
+            return changed
+        last_id = 0
+        while True:
+            rows = query_all(
+                """
+                SELECT id FROM feedback
+                WHERE subject_id=%s AND moderation_status=%s AND id > %s
+                ORDER BY id LIMIT %s FOR UPDATE
+                """,
+                (subject_id, from_status, last_id, MODERATION_BULK_CHUNK_SIZE),
+            )
+            if not rows:
+                return changed
+            chunk = [r['id'] for r in rows]
+            changed += _update_status_chunk(chunk, new_status)
+            last_id = chunk[-1]
+
+
+@bp.post('/admin/feedback/bulk-status')
+@login_required
+def admin_bulk_status():
+    if current_user.role != 'admin':
+        return redirect(url_for('routes.dashboard'))
+
+    statuses = ('pending', 'approved', 'rejected')
+    new_status = request.form.get('status')
+    subject_id = request.form.get('subject_id', type=int)
+    from_status = request.form.get('from_status')
+    back = url_for('routes.admin_feedback', subject_id=subject_id, status=from_status) if subject_id \
+        else url_for('routes.admin_feedback')
+    if new_status not in statuses:
+        flash('Invalid status', 'error')
+        return redirect(back)
+
+    if request.form.get('scope') == 'all':
+        if not subject_id or from_status not in statuses:
+            flash('Pick a subject and status to moderate', 'error')
+            return redirect(back)
+        if from_status == new_status:
+            changed = 0
+        else:
+            changed = _bulk_set_moderation_status(new_status, subject_id=subject_id, from_status=from_status)
+    else:
+        # Sorted so concurrent bulk actions lock rows in the same order
+        ids = sorted({int(i) for i in request.form.getlist('feedback_ids') if i.isdigit()})
+        if not ids:
+            flash('No feedback selected', 'error')
+            return redirect(back)
+        changed = _bulk_set_moderation_status(new_status, ids=ids)
+
+    current_app.logger.info(
+        f"bulk moderation user_id={current_user.id} subject_id={subject_id} status={new_status} changed={changed}"
+    )
+    flash(f'{changed} feedback item(s) set to {new_status}', 'success')
+    return redirect(back)
+
+
 @bp.get('/admin/users')
 @login_required
 def admin_users():
@@ -475,6 +676,7 @@ def admin_delete_user(user_id: int):
         return redirect(url_for('routes.admin_users'))
     
     execute("DELETE FROM users WHERE id=%s", (user_id,))
+    invalidate_user(user_id)
     flash(f'User {user["username"]} has been deleted', 'success')
     return redirect(url_for('routes.admin_users'))
 
@@ -495,14 +697,16 @@ def admin_promote_user(user_id: int):
         flash('User not found', 'error')
         return redirect(url_for('routes.admin_users'))
     
-    # Update user role
-    execute("UPDATE users SET role=%s WHERE id=%s", (new_role, user_id))
-    
-    # If promoting to teacher, ensure teacher record exists
-    if new_role == 'teacher':
-        teacher_exists = query_one("SELECT id FROM teachers WHERE user_id=%s", (user_id,))
-        if not teacher_exists:
-            execute("INSERT INTO teachers (user_id) VALUES (%s)", (user_id,))
+    with transaction():
+        # Update user role
+        execute("UPDATE users SET role=%s WHERE id=%s", (new_role, user_id))
+
+        # If promoting to teacher, ensure teacher record exists
+        if new_role == 'teacher':
+            teacher_exists = query_one("SELECT id FROM teachers WHERE user_id=%s", (user_id,))
+            if not teacher_exists:
+                execute("INSERT INTO teachers (user_id) VALUES (%s)", (user_id,))
+    invalidate_user(user_id)
     
     flash(f'User {user["username"]} role changed to {new_role}', 'success')
     return redirect(url_for('routes.admin_users'))
@@ -537,7 +741,8 @@ def admin_teacher_subjects(teacher_id: int):
         WHERE ts.teacher_id = %s
         ORDER BY s.name
         """,
-        (teacher_id,)
+        (teacher_id,),
+        cache_ttl=QUERY_CACHE_TTL,
     )
     
     # Get all available subjects
@@ -546,7 +751,8 @@ def admin_teacher_subjects(teacher_id: int):
         SELECT s.id, s.name
         FROM subjects s
         ORDER BY s.name
-        """
+        """,
+        cache_ttl=QUERY_CACHE_TTL,
     )
     
     return render_template('admin_teacher_subjects.html', 
@@ -635,6 +841,10 @@ def change_username():
     
     # Update username
     execute("UPDATE users SET username=%s WHERE id=%s", (new_username, current_user.id))
+    invalidate_user(current_user.id)
+    if current_user.role == 'teacher':
+        # Teacher names are shown from reference data, which does not watch users
+        mark_written({'teachers'})
     
     # Update current user object
     current_user.username = new_username
@@ -668,11 +878,11 @@ def change_password():
         return redirect(url_for('routes.account_settings'))
     
     # Hash new password
-    from werkzeug.security import generate_password_hash
-    new_password_hash = generate_password_hash(new_password)
+    new_password_hash = hash_password(new_password)
     
     # Update password
     execute("UPDATE users SET password_hash=%s WHERE id=%s", (new_password_hash, current_user.id))
+    invalidate_user(current_user.id)
     
     flash('Password updated successfully', 'success')
     return redirect(url_for('routes.account_settings'))
@@ -698,6 +908,7 @@ def delete_account():
     
     # Delete user (cascades will handle related records)
     execute("DELETE FROM users WHERE id=%s", (current_user.id,))
+    invalidate_user(current_user.id)
     
     # Logout user
     logout_user()
@@ -712,35 +923,94 @@ def mark_feedback_read(feedback_id: int):
     if current_user.role != 'teacher':
         return redirect(url_for('routes.dashboard'))
 
-    teacher_row = query_one("SELECT id FROM teachers WHERE user_id=%s", (int(current_user.id),))
-    if not teacher_row:
+    teacher_id = current_user.teacher_id
+    if not teacher_id:
         return redirect(url_for('routes.dashboard'))
-    teacher_id = teacher_row['id']
 
-    execute(
-        "UPDATE feedback SET is_read=1 WHERE id=%s AND teacher_id=%s",
-        (feedback_id, teacher_id),
-    )
+    with transaction():
+        fb = query_one(
+            "SELECT teacher_id, subject_id, moderation_status, is_read FROM feedback WHERE id=%s AND teacher_id=%s FOR UPDATE",
+            (feedback_id, teacher_id),
+        )
+        if fb and not fb['is_read']:
+            execute(
+                "UPDATE feedback SET is_read=1 WHERE id=%s AND teacher_id=%s",
+                (feedback_id, teacher_id),
+            )
+            counters.record_change(fb, is_read=1)
     flash('Marked as read', 'success')
     current_app.logger.info(f"mark_read feedback_id={feedback_id} by teacher_user_id={current_user.id}")
-    # Redirect back to current subject/filter if provided, else overview
+    # Redirect back to current subject/filter/page if provided, else overview
     subject_id = request.args.get('subject_id')
-    unread = request.args.get('unread')
     if subject_id:
-        return redirect(url_for('routes.teacher_feedback', subject_id=int(subject_id), unread=unread))
+        return redirect(url_for('routes.teacher_feedback', subject_id=int(subject_id), unread=request.args.get('unread'),
+                                after=request.args.get('after'), before=request.args.get('before')))
     return redirect(url_for('routes.teacher_feedback'))
 
 
-@bp.route('/feedback/<int:feedback_id>/thread', methods=['GET', 'POST'])
+def _mark_read(teacher_id: int, subject_id: int, ids: list = None, upto: tuple = None) -> int:
+    """Mark approved unread feedback read in one UPDATE, by id set or up to a (created_at, id) cursor."""
+    where = "teacher_id=%s AND subject_id=%s AND moderation_status='approved' AND is_read=0"
+    params = [teacher_id, subject_id]
+    if ids is not None:
+        where += f" AND id IN ({', '.join(['%s'] * len(ids))})"
+        params += ids
+    else:
+        where += " AND (created_at < %s OR (created_at = %s AND id <= %s))"
+        params += [upto[0], upto[0], upto[1]]
+    with transaction():
+        changed = execute_rowcount(f"UPDATE feedback SET is_read=1 WHERE {where}", tuple(params))
+        # Every changed row moved from approved/unread to approved/read for this teacher and subject
+        if changed:
+            counters.apply([
+                (teacher_id, subject_id, 'approved', 0, -changed),
+                (teacher_id, subject_id, 'approved', 1, changed),
+            ])
+    return changed
+
+
+@bp.post('/teacher/feedback/mark-read')
 @login_required
-def feedback_thread(feedback_id: int):
-    # authorize: teacher who owns it or student who posted it
+def mark_feedback_read_bulk():
+    if current_user.role != 'teacher':
+        return redirect(url_for('routes.dashboard'))
+
+    teacher_id = current_user.teacher_id
+    subject_id = request.form.get('subject_id', type=int)
+    if not teacher_id or not subject_id:
+        return redirect(url_for('routes.teacher_feedback'))
+
+    if request.form.get('scope') == 'all':
+        upto = decode_cursor(request.form.get('upto'))
+        changed = _mark_read(teacher_id, subject_id, upto=upto) if upto else 0
+    else:
+        ids = sorted({int(i) for i in request.form.getlist('feedback_ids') if i.isdigit()})
+        changed = _mark_read(teacher_id, subject_id, ids=ids) if ids else 0
+
+    if changed:
+        flash(f'Marked {changed} feedback item(s) as read', 'success')
+    else:
+        flash('Nothing to mark as read', 'info')
+    current_app.logger.info(
+        f"mark_read bulk subject_id={subject_id} changed={changed} by teacher_user_id={current_user.id}"
+    )
+    return redirect(url_for('routes.teacher_feedback', subject_id=subject_id, unread=request.form.get('unread') or None,
+                            after=request.form.get('after') or None, before=request.form.get('before') or None))
+
+
+def _thread_for_user(feedback_id: int):
+    """The feedback row if the current user may read its thread, else None.
+
+    Allowed: the teacher who owns it or the student who posted it.
+    """
     fb = query_one(
         """
         SELECT f.id, f.student_id, f.teacher_id, f.title, f.info,
                s.name AS subject_name,
                u_t.username AS teacher_name,
-               u_s.username AS student_name
+               u_s.username AS student_name,
+               UNIX_TIMESTAMP(f.updated_at) AS updated_ts,
+               (SELECT MAX(fm.id) FROM feedback_messages fm WHERE fm.feedback_id = f.id) AS last_message_id
         FROM feedback f
         JOIN subjects s ON s.id = f.subject_id
         JOIN teachers t ON t.id = f.teacher_id
@@ -751,45 +1021,98 @@ def feedback_thread(feedback_id: int):
         (feedback_id,),
     )
     if not fb:
-        return redirect(url_for('routes.dashboard'))
+        return None
+    if current_user.role == 'teacher':
+        allowed = bool(current_user.teacher_id and current_user.teacher_id == fb['teacher_id'])
+    elif current_user.role == 'student':
+        allowed = (fb['student_id'] == int(current_user.id))
+    else:
+        allowed = False
+    return fb if allowed else None
 
-    is_teacher = current_user.role == 'teacher'
-    is_student = current_user.role == 'student'
 
-    allowed = False
-    if is_teacher:
-        teacher_row = query_one("SELECT id FROM teachers WHERE user_id=%s", (int(current_user.id),))
-        allowed = bool(teacher_row and teacher_row['id'] == fb['teacher_id'])
-    elif is_student:
-        allowed = (fb['student_id'] == int(current_user.id))
+def _message_json(m) -> dict:
+    return {'id': m['id'], 'sender_name': m['sender_name'], 'message': m['message'], 'created_at': str(m['created_at'])}
 
-    if not allowed:
+
+@bp.route('/feedback/<int:feedback_id>/thread', methods=['GET', 'POST'])
+@login_required
+def feedback_thread(feedback_id: int):
+    fb = _thread_for_user(feedback_id)
+    if not fb:
         return redirect(url_for('routes.dashboard'))
 
+    wants_json = request.accept_mimetypes.best == 'application/json'
     if request.method == 'POST':
         message = request.form.get('message', '').strip()
         if message:
-            execute(
+            message_id = execute(
                 'INSERT INTO feedback_messages (feedback_id, sender_user_id, message) VALUES (%s, %s, %s)',
                 (feedback_id, int(current_user.id), message),
             )
+            watcher.publish(feedback_id, message_id)
             current_app.logger.info(f"thread message feedback_id={feedback_id} by user_id={current_user.id}")
+            if wants_json:
+                # The page picks the message up from its stream; no need to re-render the thread
+                return jsonify(id=message_id), 201
             return redirect(url_for('routes.feedback_thread', feedback_id=feedback_id))
+        if wants_json:
+            return jsonify(error='Message is empty'), 400
 
-    messages = query_all(
-        """
-        SELECT fm.id, fm.message, fm.created_at,
-               CASE WHEN u.role = 'teacher' THEN CONCAT(u.username, ' (Teacher)') ELSE 'Student' END AS sender_name
-        FROM feedback_messages fm
-        JOIN users u ON u.id = fm.sender_user_id
-        WHERE fm.feedback_id=%s
-        ORDER BY fm.created_at ASC
-        """,
-        (feedback_id,),
-    )
+    # The row already carries everything the page shows apart from the messages, and their newest id
+    cached = not_modified(*fb.values(), last_modified=fb['updated_ts'])
+    if cached:
+        return cached
+
+    messages = messages_after(feedback_id)
     # Do not leak student identity in header either
     fb_public = dict(fb)
     if fb_public.get('student_id'):
         fb_public['student_name'] = 'Student'
     return render_template('feedback_thread.html', fb=fb_public, messages=messages)
 
+
+@bp.get('/feedback/<int:feedback_id>/messages')
+@login_required
+def feedback_messages(feedback_id: int):
+    """Messages newer than ?after=<message id>, for clients catching up without a stream."""
+    if not _thread_for_user(feedback_id):
+        return jsonify(error='Not found'), 404
+    after = request.args.get('after', 0, type=int)
+    messages = [_message_json(m) for m in messages_after(feedback_id, after)]
+    return jsonify(messages=messages, last_id=messages[-1]['id'] if messages else after)
+
+
+@bp.get('/feedback/<int:feedback_id>/stream')
+@login_required
+def feedback_stream(feedback_id: int):
+    """Server-Sent Events: one `message` event per new thread message."""
+    if not _thread_for_user(feedback_id):
+        return jsonify(error='Not found'), 404
+    # EventSource sends Last-Event-ID when it reconnects
+    last_id = request.headers.get('Last-Event-ID', type=int) or request.args.get('after', 0, type=int)
+    if not stream_slots.acquire():
+        # EventSource gives up on a 503; the page then polls /messages
+        return ("Too many live streams, please retry", 503, {'Retry-After': str(LIVE_RETRY_MS // 1000 or 1)})
+
+    def generate(last_id):
+        # Runs after the request has been torn down, so the request's connection is
+        # already back in the pool and each query below borrows one just for itself
+        deadline = time.monotonic() + LIVE_STREAM_MAX_AGE
+        yield f"retry: {LIVE_RETRY_MS}\n\n"
+        with watcher.watch(feedback_id):
+            while time.monotonic() < deadline:
+                latest = watcher.wait(feedback_id, last_id, LIVE_HEARTBEAT)
+                if latest <= last_id:
+                    yield ": keepalive\n\n"
+                    continue
+                for m in messages_after(feedback_id, last_id):
+                    last_id = m['id']
+                    yield f"id: {m['id']}\nevent: message\ndata: {json.dumps(_message_json(m))}\n\n"
+                last_id = max(last_id, latest)
+
+    response = Response(generate(last_id), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Also runs when the client went away before the generator started
+    response.call_on_close(stream_slots.release)
+    return response
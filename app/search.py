@@ -0,0 +1,85 @@
+import re
+from .db import query_all
+from config import SEARCH_PAGE_SIZE, SEARCH_MAX_PAGES
+
+
+# Ranked full-text search over feedback (title, info) and thread messages, using
+# the FULLTEXT indexes from sql/migrations/0003_fulltext_search.sql. A feedback
+# item's score is the sum of its own relevance and that of its matching messages.
+#
+# The user's scope is applied inside each MATCH branch, and each branch keeps
+# only its best rows (enough for the deepest page /search serves), so a common
+# word costs the matches this user can see rather than every match on the site.
+
+_WORDS = re.compile(r'\w+', re.UNICODE)
+
+_MATCH_SQL = """
+    SELECT f.id, f.title, f.info, f.moderation_status, f.is_read, f.created_at, f.subject_id,
+           s.name AS subject_name, u_t.username AS teacher_name, hits.score
+    FROM (
+        SELECT feedback_id, SUM(score) AS score
+        FROM (
+            (SELECT f.id AS feedback_id, MATCH(f.title, f.info) AGAINST (%s IN BOOLEAN MODE) AS score
+             FROM feedback f
+             WHERE MATCH(f.title, f.info) AGAINST (%s IN BOOLEAN MODE) AND {scope}
+             ORDER BY score DESC
+             LIMIT %s)
+            {messages}
+        ) matches
+        GROUP BY feedback_id
+    ) hits
+    JOIN feedback f ON f.id = hits.feedback_id
+    JOIN subjects s ON s.id = f.subject_id
+    JOIN teachers t ON t.id = f.teacher_id
+    JOIN users u_t ON u_t.id = t.user_id
+    ORDER BY hits.score DESC, f.id DESC
+    LIMIT %s OFFSET %s
+"""
+
+_MESSAGES_SQL = """
+            UNION ALL
+            (SELECT m.feedback_id, MATCH(m.message) AGAINST (%s IN BOOLEAN MODE) AS score
+             FROM feedback_messages m
+             JOIN feedback f ON f.id = m.feedback_id
+             WHERE MATCH(m.message) AGAINST (%s IN BOOLEAN MODE) AND {scope}
+             ORDER BY score DESC
+             LIMIT %s)
+"""
+
+
+def boolean_query(text: str) -> str:
+    """Every word required, matched as a prefix; operators typed by the user are dropped."""
+    return ' '.join(f'+{word}*' for word in _WORDS.findall(text)[:16])
+
+
+def _scope(user):
+    """WHERE clause and params limiting hits to what the routes let this user see.
+
+    Returns (where, params, include_messages) or None when the user may see nothing.
+    """
+    if user.role == 'admin':
+        # Admins moderate feedback but do not take part in threads
+        return '1=1', (), False
+    if user.role == 'teacher':
+        if not user.teacher_id:
+            return None
+        return "f.teacher_id=%s AND f.moderation_status='approved'", (user.teacher_id,), True
+    return 'f.student_id=%s', (int(user.id),), True
+
+
+def search_feedback(user, text: str, page: int = 1, page_size: int = SEARCH_PAGE_SIZE):
+    """(hits, has_next) for one page of results, best match first."""
+    terms = boolean_query(text)
+    scope = _scope(user)
+    if not terms or scope is None:
+        return [], False
+    where, scope_params, include_messages = scope
+    # Independent of the page, so every page ranks the same candidates
+    branch_limit = page_size * SEARCH_MAX_PAGES + 1
+    branch = (terms, terms) + scope_params + (branch_limit,)
+    messages = _MESSAGES_SQL.format(scope=where) if include_messages else ''
+    rows = query_all(
+        _MATCH_SQL.format(messages=messages, scope=where),
+        branch + (branch if include_messages else ()) + (page_size + 1, (page - 1) * page_size),
+    )
+    return rows[:page_size], len(rows) > page_size
@@ -0,0 +1,78 @@
+// JS for feedback_thread page: live updates over Server-Sent Events, or by polling when no stream is available
+(function(){
+  var list = document.getElementById('thread-messages');
+  if (!list) return;
+  var lastId = parseInt(list.getAttribute('data-last-id') || '0', 10);
+  var messagesUrl = list.getAttribute('data-messages-url');
+  var form = document.getElementById('thread-form');
+
+  function append(m){
+    if (m.id <= lastId) return;  // already shown (stream and catch-up can overlap)
+    lastId = m.id;
+    var empty = document.getElementById('thread-empty');
+    if (empty) empty.remove();
+    if (list.children.length) {
+      var hr = document.createElement('hr');
+      hr.className = 'separator';
+      list.appendChild(hr);
+    }
+    var row = document.createElement('div');
+    row.className = 'space-between align-start mb-2';
+    var body = document.createElement('div');
+    body.className = 'vstack';
+    var sender = document.createElement('strong');
+    sender.textContent = m.sender_name;
+    var text = document.createElement('div');
+    text.textContent = m.message;
+    var when = document.createElement('div');
+    when.className = 'tag';
+    when.textContent = m.created_at;
+    body.appendChild(sender);
+    body.appendChild(text);
+    row.appendChild(body);
+    row.appendChild(when);
+    list.appendChild(row);
+  }
+
+  function catchUp(){
+    return fetch(messagesUrl + '?after=' + lastId, {headers: {'Accept': 'application/json'}})
+      .then(function(r){ return r.ok ? r.json() : {messages: []}; })
+      .then(function(data){ data.messages.forEach(append); });
+  }
+
+  var POLL_MS = 5000;
+  var polling = null;
+  function startPolling(){
+    if (polling || !window.fetch) return;
+    polling = setInterval(catchUp, POLL_MS);
+  }
+
+  if (window.EventSource) {
+    var source = new EventSource(list.getAttribute('data-stream-url') + '?after=' + lastId);
+    source.addEventListener('message', function(e){ append(JSON.parse(e.data)); });
+    // The browser reconnects by itself after a dropped stream, but not after an
+    // error response (the server refuses streams above its limit with a 503)
+    source.addEventListener('error', function(){
+      if (source.readyState === EventSource.CLOSED) startPolling();
+    });
+  } else {
+    startPolling();
+  }
+
+  if (form && window.fetch) {
+    form.addEventListener('submit', function(e){
+      e.preventDefault();
+      var textarea = form.querySelector('textarea[name="message"]');
+      if (!textarea.value.trim()) return;
+      fetch(form.action || window.location.href, {
+        method: 'POST',
+        body: new FormData(form),
+        headers: {'Accept': 'application/json'}
+      }).then(function(r){
+        if (!r.ok) { form.submit(); return; }
+        textarea.value = '';
+        return catchUp();
+      });
+    });
+  }
+})();
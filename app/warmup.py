@@ -0,0 +1,57 @@
+import logging
+import time
+from . import refdata
+from .auth import needs_rehash
+from .db import MySQLPool
+from .invalidation import bus
+
+
+# One-off costs of a new process, paid before it takes traffic instead of by
+# its first requests. Every step is optional: if one fails (the database is
+# not up yet) the worker starts anyway and the lazy paths retry on first use.
+#
+# Under gunicorn --preload the master runs this once and closes its pool
+# before forking; the workers inherit the compiled templates and reference
+# data and only open their own connections (see gunicorn.conf.py).
+
+log = logging.getLogger('bzz.warmup')
+
+
+def _compile_templates(app) -> int:
+    names = app.jinja_env.list_templates()
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def _load_refdata(app) -> None:
+    with app.app_context():
+        refdata.current()
+
+
+def warm_up(app, connections: bool = True) -> dict:
+    """Compile templates, prime in-process caches and (optionally) open the pool's min_size connections.
+
+    Returns the seconds each step took.
+    """
+    steps = [('templates', lambda: _compile_templates(app))]
+    if connections:
+        steps.append(('pool', MySQLPool.init_pool))
+    steps += [
+        # Before anything is cached, so later invalidations are not skipped; a worker
+        # forked from a warmed master keeps the master's position instead
+        ('invalidation', bus.ensure_synced),
+        ('refdata', lambda: _load_refdata(app)),
+        # Resolves and caches the configured hash parameters (one full hash)
+        ('password_hash', lambda: needs_rehash('')),
+    ]
+    timings = {}
+    for name, step in steps:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            log.exception("warm-up step %s failed", name)
+        timings[name] = time.perf_counter() - started
+    log.info("warm-up done %s", ' '.join(f"{name}_ms={s * 1000:.1f}" for name, s in timings.items()))
+    return timings
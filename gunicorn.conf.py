@@ -0,0 +1,69 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+
+# gunicorn -c gunicorn.conf.py
+#
+# Sizes follow the CPU count unless set explicitly. Requests are mostly
+# waiting on MySQL and open feedback threads hold a thread for the whole SSE
+# stream, so each worker runs many threads; the DB pool is sized so that all
+# workers together stay under DB_MAX_CONNECTIONS.
+
+cpus = multiprocessing.cpu_count()
+
+wsgi_app = 'wsgi:app'
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = 'gthread'
+workers = int(os.getenv('GUNICORN_WORKERS', str(cpus + 1)))
+threads = int(os.getenv('GUNICORN_THREADS', '16'))
+# Import the app and warm it once in the master; workers start warm
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+# config.py reads these when the app is imported, which happens after this file
+_budget = int(os.getenv('DB_MAX_CONNECTIONS', '150'))
+os.environ.setdefault('DB_POOL_MAX_SIZE', str(max(2, min(threads, _budget // workers))))
+os.environ.setdefault('DB_POOL_MIN_SIZE', str(min(2, int(os.environ['DB_POOL_MAX_SIZE']))))
+# Live streams may take at most half of a worker's threads; the rest serve pages
+os.environ.setdefault('LIVE_MAX_STREAMS', str(max(1, threads // 2)))
+# Workers share their metrics through this directory so /metrics covers all of them
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), f'bzz-metrics-{bind.rsplit(":", 1)[-1]}'))
+
+
+def on_starting(server):
+    # Snapshots of a previous run's workers would be counted again
+    shutil.rmtree(os.environ['METRICS_DIR'], ignore_errors=True)
+
+
+def when_ready(server):
+    # Master, before the first fork; only has the app when it is preloaded
+    if not server.cfg.preload_app:
+        return
+    from app.db import MySQLPool
+    from app.warmup import warm_up
+    warm_up(server.app.wsgi(), connections=False)
+    # Workers must not inherit open sockets (app.db also resets its pools after fork)
+    MySQLPool.close()
+
+
+def post_worker_init(worker):
+    # Worker, app loaded, not yet accepting connections
+    from app.warmup import warm_up
+    warm_up(worker.wsgi)
+
+
+def worker_exit(server, worker):
+    # Worker, on its way out: leave its final numbers for child_exit
+    from app import metrics
+    if metrics.METRICS_ENABLED and metrics.METRICS_DIR:
+        metrics.flush()
+
+
+def child_exit(server, worker):
+    # Master: keep the exited worker's counts without keeping a file per pid forever
+    from app import metrics
+    metrics.retire(worker.pid)
@@ -1,11 +1,9 @@
 from app.main import create_app
 
 
-app = create_app()
-
-
 if __name__ == "__main__":
+    # Built here, not at import: the password-hashing pool spawns processes
+    # that re-import this module, and they must not create an app of their own
+    app = create_app()
     # Default to localhost:5000 with debug reload for dev convenience
     app.run(host="127.0.0.1", port=5000, debug=True)
-
-
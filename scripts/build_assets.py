@@ -0,0 +1,25 @@
+import os
+import sys
+
+# Ensure project root for app/config imports
+CURRENT_DIR = os.path.dirname(__file__)
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from app.assets import build, brotli
+from config import ASSETS_DIST_DIR
+
+
+def main():
+    print(f"📦 Building static assets into {ASSETS_DIST_DIR}...")
+    manifest = build()
+    for logical, hashed in sorted(manifest.items()):
+        print(f"  {logical} -> {hashed}")
+    if brotli is None:
+        print("⚠️ brotli not installed, only gzip variants written (pip install brotli)")
+    print(f"✅ {len(manifest)} assets built.")
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,7 @@ if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
 from config import DB_CONFIG, LOG_DIR
+from scripts.migrate import run_migrations
 
 
 def get_mysql_connection_without_db():
@@ -47,6 +48,8 @@ def get_sql_files(path):
     sql_files = {}
 
     for root, dirs, files in os.walk(path):
+        # Migrations are applied separately, in version order, by run_migrations
+        dirs[:] = [d for d in dirs if d != 'migrations']
         for file in files:
             if file.endswith('.sql'):
                 full_path = os.path.join(root, file)
@@ -239,6 +242,15 @@ def main():
     # Execute all SQL files in correct order
     success = execute_all_sql_files(sql_files_path, db_connection)
 
+    # Bring the fresh schema up to the latest migration
+    if success:
+        print("\n🔧 Applying migrations...")
+        try:
+            run_migrations(db_connection)
+        except Exception as e:
+            print(f"❌ Failed to apply migrations: {e}")
+            success = False
+
     # After schema + seed, set valid werkzeug password hashes for demo users
     if success:
         try:
@@ -0,0 +1,172 @@
+import hashlib
+import os
+import re
+import sys
+import time
+import mysql.connector
+from mysql.connector import errorcode
+
+# Ensure project root is on sys.path for 'config' import when running as a script
+CURRENT_DIR = os.path.dirname(__file__)
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from config import DB_CONFIG, DB_MIGRATION_LOCK_WAIT_TIMEOUT, DB_MIGRATION_RETRIES
+
+
+# Forward-only schema migrations for live databases.
+#
+# Files in sql/migrations are named NNNN_description.sql and applied in version
+# order, each exactly once; applied versions are recorded in schema_version.
+# Never edit a migration that has shipped, add a new one instead.
+#
+# ALTERs should ask for ALGORITHM=INPLACE, LOCK=NONE so MySQL refuses instead of
+# copying the table under a write lock. DDL still needs a brief metadata lock, so
+# the session's lock_wait_timeout is kept short and the statement retried rather
+# than letting it queue up every query behind it.
+
+MIGRATIONS_DIR = os.path.join(PROJECT_ROOT, 'sql', 'migrations')
+MIGRATION_FILE = re.compile(r'^(\d+)_(\w+)\.sql$')
+ADVISORY_LOCK = 'bzzfeedback_schema_migrations'
+
+SCHEMA_VERSION_SQL = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INT PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    checksum CHAR(64) NOT NULL,
+    duration_ms INT NOT NULL DEFAULT 0,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+
+def find_migrations(path=MIGRATIONS_DIR):
+    """[(version, name, path)] sorted by version"""
+    migrations = []
+    for file in os.listdir(path) if os.path.isdir(path) else []:
+        match = MIGRATION_FILE.match(file)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(path, file)))
+    migrations.sort()
+    versions = [m[0] for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError(f"Duplicate migration versions in {path}")
+    return migrations
+
+
+def read_statements(file_path):
+    """Split a migration file into statements, dropping -- comment lines"""
+    with open(file_path, 'r') as f:
+        content = f.read()
+    lines = [line for line in content.split('\n') if line.strip() and not line.strip().startswith('--')]
+    return [stmt.strip() for stmt in '\n'.join(lines).split(';') if stmt.strip()]
+
+
+def checksum(file_path):
+    with open(file_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def applied_versions(connection):
+    cursor = connection.cursor()
+    cursor.execute(SCHEMA_VERSION_SQL)
+    cursor.execute("SELECT version, checksum FROM schema_version")
+    applied = {version: digest for version, digest in cursor.fetchall()}
+    cursor.close()
+    return applied
+
+
+def execute_online(connection, statement):
+    """Run one statement, retrying when it cannot get its metadata lock in time"""
+    for attempt in range(DB_MIGRATION_RETRIES + 1):
+        cursor = connection.cursor()
+        try:
+            cursor.execute(statement)
+            connection.commit()
+            return
+        except mysql.connector.Error as e:
+            connection.rollback()
+            if e.errno in (errorcode.ER_DUP_KEYNAME, errorcode.ER_DUP_FIELDNAME):
+                # Index/column left behind by an earlier run that failed part way through
+                print(f"  ⚠️ Already present, skipping: {e.msg}")
+                return
+            if e.errno != errorcode.ER_LOCK_WAIT_TIMEOUT or attempt == DB_MIGRATION_RETRIES:
+                raise
+            delay = min(2 ** attempt, 30)
+            print(f"  ⏳ Lock wait timeout, retrying in {delay}s...")
+            time.sleep(delay)
+        finally:
+            cursor.close()
+
+
+def run_migrations(connection, path=MIGRATIONS_DIR):
+    """Apply pending migrations in order. Returns the number applied."""
+    cursor = connection.cursor()
+    cursor.execute("SET SESSION lock_wait_timeout = %s", (DB_MIGRATION_LOCK_WAIT_TIMEOUT,))
+    cursor.execute("SELECT GET_LOCK(%s, 0)", (ADVISORY_LOCK,))
+    (locked,) = cursor.fetchone()
+    cursor.close()
+    if not locked:
+        raise RuntimeError("Another migration run is in progress")
+
+    try:
+        applied = applied_versions(connection)
+        count = 0
+        for version, name, file_path in find_migrations(path):
+            digest = checksum(file_path)
+            if version in applied:
+                if applied[version] != digest:
+                    print(f"⚠️ Migration {version:04d}_{name} changed after it was applied")
+                continue
+            print(f"🔧 Applying {version:04d}_{name}...")
+            started = time.perf_counter()
+            for statement in read_statements(file_path):
+                execute_online(connection, statement)
+            duration_ms = int((time.perf_counter() - started) * 1000)
+            cursor = connection.cursor()
+            cursor.execute(
+                "INSERT INTO schema_version (version, name, checksum, duration_ms) VALUES (%s, %s, %s, %s)",
+                (version, name, digest, duration_ms),
+            )
+            connection.commit()
+            cursor.close()
+            print(f"✓ Applied {version:04d}_{name} in {duration_ms}ms")
+            count += 1
+        return count
+    finally:
+        cursor = connection.cursor()
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (ADVISORY_LOCK,))
+        cursor.fetchall()
+        cursor.close()
+
+
+def print_status(connection):
+    applied = applied_versions(connection)
+    for version, name, _ in find_migrations():
+        mark = '✓' if version in applied else '·'
+        print(f"  {mark} {version:04d}_{name}")
+
+
+def main():
+    try:
+        connection = mysql.connector.connect(**DB_CONFIG)
+    except Exception as e:
+        print(f"❌ Failed to connect to MySQL: {str(e)}")
+        sys.exit(1)
+
+    try:
+        if '--status' in sys.argv[1:]:
+            print_status(connection)
+            return
+        count = run_migrations(connection)
+        print(f"✅ {count} migration(s) applied." if count else "✅ Schema is up to date.")
+    except Exception as e:
+        print(f"❌ Migration failed: {str(e)}")
+        sys.exit(1)
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
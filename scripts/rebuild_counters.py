@@ -0,0 +1,21 @@
+import os
+import sys
+
+# Ensure project root for app/config imports
+CURRENT_DIR = os.path.dirname(__file__)
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from app.counters import rebuild
+
+
+def main():
+    chunk_size = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    print(f"🔢 Rebuilding feedback_counters ({chunk_size} teachers per transaction)...")
+    rows = rebuild(chunk_size)
+    print(f"✅ Rebuilt {rows} counter rows.")
+
+
+if __name__ == '__main__':
+    main()
@@ -202,6 +202,10 @@ def main():
         conn.commit()
         print(f"Created {created} demo feedback entries.")
 
+        # Feedback was inserted directly, so bring the overview counters up to date
+        from app.counters import rebuild
+        rebuild()
+
     finally:
         conn.close()
 
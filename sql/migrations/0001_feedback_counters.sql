@@ -0,0 +1,34 @@
+-- Per (teacher, subject) feedback counts, kept in step with feedback by app/counters.py.
+-- read_count/unread_count only cover approved feedback, which is what teachers see.
+-- This migration is the only definition of the table: it creates it (init_db.py runs
+-- migrations after sql/) and backfills it from whatever feedback already exists.
+CREATE TABLE IF NOT EXISTS feedback_counters (
+    teacher_id INT NOT NULL,
+    subject_id INT NOT NULL,
+    pending_count INT NOT NULL DEFAULT 0,
+    approved_count INT NOT NULL DEFAULT 0,
+    rejected_count INT NOT NULL DEFAULT 0,
+    read_count INT NOT NULL DEFAULT 0,
+    unread_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (teacher_id, subject_id),
+    KEY idx_fcnt_subject (subject_id),
+    CONSTRAINT fk_fcnt_teacher FOREIGN KEY (teacher_id) REFERENCES teachers(id) ON DELETE CASCADE,
+    CONSTRAINT fk_fcnt_subject FOREIGN KEY (subject_id) REFERENCES subjects(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+INSERT INTO feedback_counters (teacher_id, subject_id, pending_count, approved_count,
+                               rejected_count, read_count, unread_count)
+SELECT teacher_id, subject_id,
+       SUM(moderation_status = 'pending'),
+       SUM(moderation_status = 'approved'),
+       SUM(moderation_status = 'rejected'),
+       SUM(moderation_status = 'approved' AND is_read = 1),
+       SUM(moderation_status = 'approved' AND is_read = 0)
+FROM feedback
+GROUP BY teacher_id, subject_id
+ON DUPLICATE KEY UPDATE
+    pending_count = VALUES(pending_count),
+    approved_count = VALUES(approved_count),
+    rejected_count = VALUES(rejected_count),
+    read_count = VALUES(read_count),
+    unread_count = VALUES(unread_count);
@@ -0,0 +1,18 @@
+-- Composite indexes for the feedback list and thread queries in app/routes.py.
+-- Trailing created_at (plus the implicit primary key) serves the (created_at, id) keyset order.
+-- ALGORITHM=INPLACE, LOCK=NONE makes MySQL refuse rather than block writes while building.
+
+-- Teacher subject list: teacher_id, subject_id, moderation_status [, is_read]
+ALTER TABLE feedback ADD INDEX idx_fb_teacher_subject_status (teacher_id, subject_id, moderation_status, is_read, created_at), ALGORITHM=INPLACE, LOCK=NONE;
+
+-- My feedback: student_id
+ALTER TABLE feedback ADD INDEX idx_fb_student_created (student_id, created_at), ALGORITHM=INPLACE, LOCK=NONE;
+
+-- Admin moderation list: subject_id, moderation_status
+ALTER TABLE feedback ADD INDEX idx_fb_subject_status_created (subject_id, moderation_status, created_at), ALGORITHM=INPLACE, LOCK=NONE;
+
+-- Feedback thread messages in order
+ALTER TABLE feedback_messages ADD INDEX idx_fm_feedback_created (feedback_id, created_at), ALGORITHM=INPLACE, LOCK=NONE;
+
+-- Dashboard: teachers of a class (the primary key leads with teacher_id)
+ALTER TABLE teacher_classes ADD INDEX idx_tc_class (class_name, teacher_id), ALGORITHM=INPLACE, LOCK=NONE;
@@ -0,0 +1,8 @@
+-- FULLTEXT indexes behind /search (app/search.py).
+-- InnoDB cannot build FULLTEXT indexes with LOCK=NONE: reads continue during the
+-- build but writes to the table wait, so run this outside peak hours on big tables.
+-- The first FULLTEXT index on a table also adds the hidden FTS_DOC_ID column (a rebuild).
+
+ALTER TABLE feedback ADD FULLTEXT INDEX ft_fb_title_info (title, info), ALGORITHM=INPLACE, LOCK=SHARED;
+
+ALTER TABLE feedback_messages ADD FULLTEXT INDEX ft_fm_message (message), ALGORITHM=INPLACE, LOCK=SHARED;
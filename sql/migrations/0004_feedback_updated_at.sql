@@ -0,0 +1,10 @@
+-- feedback.updated_at moves on every change to a row, so MAX(updated_at) per scope
+-- (plus the row counts) is a cheap version stamp for conditional GETs (app/conditional.py).
+-- Existing rows start at the time of the migration.
+
+ALTER TABLE feedback ADD COLUMN updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6), ALGORITHM=INPLACE, LOCK=NONE;
+
+-- MAX(updated_at) for a teacher's subject list and the admin moderation list is a single index dive
+ALTER TABLE feedback ADD INDEX idx_fb_teacher_subject_updated (teacher_id, subject_id, moderation_status, updated_at), ALGORITHM=INPLACE, LOCK=NONE;
+
+ALTER TABLE feedback ADD INDEX idx_fb_subject_status_updated (subject_id, moderation_status, updated_at), ALGORITHM=INPLACE, LOCK=NONE;
@@ -0,0 +1,12 @@
+-- Append-only change log that carries cache invalidations between app processes
+-- (app/invalidation.py). Every process polls for ids above the last one it has seen;
+-- rows older than INVALIDATION_RETENTION are pruned by the pollers.
+CREATE TABLE IF NOT EXISTS cache_invalidations (
+    id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT,
+    origin VARCHAR(128) NOT NULL,
+    kind VARCHAR(16) NOT NULL,
+    name VARCHAR(64) NOT NULL,
+    created_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    PRIMARY KEY (id),
+    KEY idx_ci_created (created_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
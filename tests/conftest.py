@@ -46,6 +46,16 @@ def app():
     yield app
 
 
+@pytest.fixture()
+def offline_app(monkeypatch):
+    """create_app() for tests without a database: no invalidation poller, and the
+    commit listener it registers does not outlive the test."""
+    from app import invalidation
+    monkeypatch.setattr(invalidation.bus, 'ensure_started', lambda: None)
+    monkeypatch.setattr(invalidation, 'commit_listeners', [])
+    return create_app()
+
+
 @pytest.fixture()
 def client(app):
     # Ensure passwords are set before creating client
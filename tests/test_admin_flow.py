@@ -23,3 +23,30 @@ def test_admin_moderation_flow(client):
     assert b'Approve' in resp.data or b'No feedback in this filter.' in resp.data
 
 
+def test_admin_export_feedback_csv(client):
+    from app.db import execute
+    execute("UPDATE users SET role='admin' WHERE username='alice'")
+    login(client, 'alice', 'Password123!')
+
+    resp = client.get('/admin/feedback/export.csv?subject_id=1&status=pending')
+    assert resp.status_code == 200
+    assert resp.mimetype == 'text/csv'
+    assert resp.data.splitlines()[0].startswith(b'id,created_at,subject_name')
+
+
+def test_admin_bulk_moderation(client):
+    from app.db import execute, query_one
+    execute("UPDATE users SET role='admin' WHERE username='alice'")
+    login(client, 'alice', 'Password123!')
+
+    resp = client.post('/admin/feedback/bulk-status', data={
+        'scope': 'all', 'subject_id': 1, 'from_status': 'pending', 'status': 'approved',
+    }, follow_redirects=True)
+    assert resp.status_code == 200
+    assert b'set to approved' in resp.data
+    assert query_one("SELECT COUNT(*) AS n FROM feedback WHERE subject_id=1 AND moderation_status='pending'")['n'] == 0
+
+    resp = client.post('/admin/feedback/bulk-status', data={
+        'subject_id': 1, 'from_status': 'approved', 'status': 'rejected',
+    }, follow_redirects=True)
+    assert b'No feedback selected' in resp.data
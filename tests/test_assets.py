@@ -0,0 +1,45 @@
+import gzip
+from flask import Flask
+from app import assets
+
+
+def test_build_fingerprints_and_serves_immutable_precompressed(tmp_path, monkeypatch):
+    static = tmp_path / 'static'
+    (static / 'css').mkdir(parents=True)
+    (static / 'css' / 'site.css').write_text('body { color: red; }\n' * 50)
+    dist = static / 'dist'
+
+    manifest = assets.build(str(static), str(dist))
+    hashed = manifest['css/site.css']
+    assert hashed.startswith('css/site.') and hashed.endswith('.css') and hashed != 'css/site.css'
+    assert (dist / (hashed + '.gz')).exists()
+    # The output directory is never fingerprinted itself
+    assert assets.build(str(static), str(dist)) == manifest
+
+    monkeypatch.setattr(assets, 'ASSETS_DIST_DIR', str(dist))
+    monkeypatch.setattr(assets, '_manifest', manifest)
+    app = Flask(__name__)
+    app.register_blueprint(assets.bp)
+    with app.test_request_context():
+        url = assets.asset_url('css/site.css')
+        assert url == f'/assets/{hashed}'
+        assert assets.asset_url('img/missing.png') == '/static/img/missing.png'
+
+    client = app.test_client()
+    resp = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert resp.status_code == 200
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert resp.mimetype == 'text/css'
+    assert 'immutable' in resp.headers['Cache-Control']
+    assert gzip.decompress(resp.data).startswith(b'body')
+
+    assert client.get(url).headers.get('Content-Encoding') is None
+    assert client.get('/assets/manifest.json').status_code == 404
+    assert client.get('/assets/../../etc/passwd').status_code == 404
+
+
+def test_unknown_asset_is_a_404_in_the_full_app(offline_app):
+    # The app's catch-all error handler must not turn abort(404) into a 500
+    client = offline_app.test_client()
+    assert client.get('/assets/css/missing.0123456789.css').status_code == 404
+    assert client.get('/no-such-page').status_code == 404
@@ -27,3 +27,48 @@ def test_register_student_then_login(client):
     assert b'Dashboard' in resp.data
 
 
+def test_outdated_hash_parameters_need_rehash():
+    from werkzeug.security import generate_password_hash
+    from app.auth import needs_rehash, hash_password
+    assert not needs_rehash(hash_password('Secret123!'))
+    assert needs_rehash(generate_password_hash('Secret123!', 'pbkdf2:sha256:1000'))
+
+
+def test_hashing_rejects_fast_when_queue_full(monkeypatch):
+    import threading
+    import pytest
+    from app import auth
+    slots = threading.BoundedSemaphore(1)
+    slots.acquire()
+    monkeypatch.setattr(auth, '_hash_slots', slots)
+    monkeypatch.setattr(auth, 'PASSWORD_HASH_WORKERS', 1)
+    with pytest.raises(auth.HashingBusy):
+        auth.hash_password('Secret123!')
+
+
+def test_hashing_slot_is_held_until_an_abandoned_job_finishes(monkeypatch):
+    import threading
+    import pytest
+    from concurrent.futures import Future
+    from app import auth
+    jobs = []
+
+    class ManualExecutor:
+        def submit(self, fn, *args):
+            jobs.append(Future())
+            return jobs[-1]
+
+    monkeypatch.setattr(auth, '_hash_slots', threading.BoundedSemaphore(1))
+    monkeypatch.setattr(auth, '_executor', ManualExecutor)
+    monkeypatch.setattr(auth, 'PASSWORD_HASH_WORKERS', 1)
+    monkeypatch.setattr(auth, 'PASSWORD_HASH_TIMEOUT', 0.01)
+
+    with pytest.raises(auth.HashingBusy, match='longer than'):
+        auth.hash_password('Secret123!')
+    # The timed-out job is still queued in the pool, so its slot is still taken
+    with pytest.raises(auth.HashingBusy, match='queue is full'):
+        auth.hash_password('Secret123!')
+    jobs[0].set_result('late')
+    with pytest.raises(auth.HashingBusy, match='longer than'):
+        auth.hash_password('Secret123!')
+    assert len(jobs) == 2
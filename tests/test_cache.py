@@ -0,0 +1,111 @@
+from app.cache import TTLCache
+from app.db import tables_read, tables_written
+
+
+def test_ttl_cache_lru_eviction_and_counters():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1  # 'b' is now least recently used
+    cache.set('c', 3)
+    assert cache.get('b', None) is None
+    assert cache.get('c') == 3
+    stats = cache.stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 1
+    assert stats['evictions'] == 1
+
+
+def test_ttl_cache_expiry_and_tags():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set('expired', 1, ttl=-1)
+    assert cache.get('expired', None) is None
+
+    cache.set('subjects', [1], tags=('subjects',))
+    cache.set('mapping', [2], tags=('subjects', 'teacher_subjects'))
+    cache.set('users', [3], tags=('users',))
+    assert cache.invalidate_tag('subjects') == 2
+    assert cache.get('mapping', None) is None
+    assert cache.get('users') == [3]
+
+
+def test_write_statements_map_to_tables():
+    assert tables_read("SELECT s.id FROM teacher_subjects ts JOIN subjects s ON s.id = ts.subject_id") == \
+        {'teacher_subjects', 'subjects'}
+    assert tables_written("INSERT INTO teacher_classes (teacher_id, class_name) VALUES (%s, %s)") == {'teacher_classes'}
+    assert tables_written("UPDATE users SET role=%s WHERE id=%s") == {'users'}
+    # Deleting a teacher cascades to its mappings and feedback threads
+    assert tables_written("DELETE FROM teachers WHERE id=%s") == \
+        {'teachers', 'teacher_subjects', 'teacher_classes', 'feedback', 'feedback_messages', 'feedback_counters'}
+    assert tables_written("SELECT 1") == set()
+
+
+def test_principal_cached_until_user_invalidated(monkeypatch):
+    from app import auth
+    calls = []
+
+    def fake_query_one(sql, params=()):
+        calls.append(params)
+        return {'id': 42, 'username': f'user{len(calls)}', 'role': 'teacher', 'class_name': None, 'teacher_id': 7}
+
+    monkeypatch.setattr(auth, 'query_one', fake_query_one)
+    first = auth.User.get('42')
+    assert auth.User.get(42) is first
+    assert first.teacher_id == 7
+    assert len(calls) == 1
+
+    auth.invalidate_user(42)
+    assert auth.User.get('42').username == 'user2'
+    assert len(calls) == 2
+
+
+def test_result_read_before_a_write_is_not_cached(monkeypatch):
+    from contextlib import contextmanager, nullcontext
+    from app import db
+    db.query_cache.clear()
+    rows = [[{'id': 1}], [{'id': 2}]]
+
+    class Cursor:
+        def fetchall(self):
+            return rows.pop(0)
+
+    @contextmanager
+    def cursor_with_write(conn, sql, params, buffered=False):
+        cur = Cursor()
+        yield cur
+        # Another thread commits a write after our SELECT read its rows
+        db.invalidate_tables({'subjects'})
+        monkeypatch.setattr(db, '_cursor', plain_cursor)
+
+    @contextmanager
+    def plain_cursor(conn, sql, params, buffered=False):
+        yield Cursor()
+
+    monkeypatch.setattr(db, '_connection', lambda readonly=False: nullcontext())
+    monkeypatch.setattr(db, '_cursor', cursor_with_write)
+    sql = "SELECT id FROM subjects"
+    assert db.query_all(sql, cache_ttl=60) == [{'id': 1}]
+    # The pre-write rows were not stored, so the next read goes to the database
+    assert db.query_all(sql, cache_ttl=60) == [{'id': 2}]
+    assert db.query_all(sql, cache_ttl=60) == [{'id': 2}]
+
+
+def test_login_does_not_cache_a_principal_invalidated_mid_login(monkeypatch):
+    from app import auth
+    row = {'id': 43, 'username': 'carol', 'role': 'student', 'class_name': '1A', 'teacher_id': None,
+           'password_hash': 'x'}
+
+    def query_then_role_change(sql, params=()):
+        result = dict(row)
+        # An admin changes the role right after our read
+        row['role'] = 'teacher'
+        auth._forget_user(43)
+        return result
+
+    monkeypatch.setattr(auth, 'query_one', query_then_role_change)
+    monkeypatch.setattr(auth, '_run_hash', lambda fn, *args: True)
+    monkeypatch.setattr(auth, 'needs_rehash', lambda h: False)
+    assert auth.verify_login('carol', 'pw').role == 'student'
+
+    monkeypatch.setattr(auth, 'query_one', lambda sql, params=(): dict(row))
+    assert auth.User.get(43).role == 'teacher'
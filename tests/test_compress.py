@@ -0,0 +1,74 @@
+import gzip
+import zlib
+from flask import Flask, Response
+from app import compress
+
+
+def make_app():
+    app = Flask(__name__)
+
+    @app.get('/page')
+    def page():
+        return '<p>feedback</p>' * 500
+
+    @app.get('/small')
+    def small():
+        return '<p>hi</p>'
+
+    @app.get('/stream')
+    def stream():
+        return Response((f'row {i}\n' for i in range(3)), mimetype='text/event-stream')
+
+    @app.get('/export')
+    def export():
+        return Response((f'{i},feedback,approved\n' for i in range(2000)), mimetype='text/csv')
+
+    @app.get('/not-modified')
+    def not_modified():
+        return Response(status=304)
+
+    app.after_request(compress.compress_response)
+    return app
+
+
+def test_pages_compressed_when_accepted_and_large_enough(monkeypatch):
+    monkeypatch.setattr(compress, 'brotli', None)
+    client = make_app().test_client()
+    before = compress.stats()['responses']
+
+    resp = client.get('/page', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in resp.headers['Vary']
+    assert gzip.decompress(resp.data) == b'<p>feedback</p>' * 500
+    assert int(resp.headers['Content-Length']) == len(resp.data)
+    assert compress.stats()['responses'] == before + 1
+
+    assert 'Content-Encoding' not in client.get('/page').headers
+    assert 'Content-Encoding' not in client.get('/small', headers={'Accept-Encoding': 'gzip'}).headers
+    assert 'Content-Encoding' not in client.get('/not-modified', headers={'Accept-Encoding': 'gzip'}).headers
+
+
+def test_event_streams_flush_each_chunk(monkeypatch):
+    monkeypatch.setattr(compress, 'brotli', None)
+    client = make_app().test_client()
+    resp = client.get('/stream', headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in resp.headers
+
+    chunks = list(resp.response)
+    # Every row is decodable as soon as its chunk arrives
+    d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    assert d.decompress(chunks[0]) == b'row 0\n'
+    assert b''.join(d.decompress(c) for c in chunks[1:]) == b'row 1\nrow 2\n'
+
+
+def test_other_streams_are_compressed_in_whole_blocks(monkeypatch):
+    monkeypatch.setattr(compress, 'brotli', None)
+    client = make_app().test_client()
+    resp = client.get('/export', headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    body = b''.join(resp.response)
+    raw = ''.join(f'{i},feedback,approved\n' for i in range(2000)).encode()
+    assert gzip.decompress(body) == raw
+    # No sync flush per row: about the size of compressing it in one go
+    assert len(body) < len(gzip.compress(raw)) * 1.2
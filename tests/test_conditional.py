@@ -0,0 +1,61 @@
+from flask import Flask, flash
+from flask_login import LoginManager
+from app import conditional
+
+
+def make_app(renders):
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    LoginManager(app).user_loader(lambda user_id: None)
+    conditional.init_app(app)
+    version = {'n': 1}
+
+    @app.get('/list')
+    def listing():
+        cached = conditional.not_modified(version['n'], last_modified=1700000000)
+        if cached:
+            return cached
+        renders.append(1)
+        return 'rendered'
+
+    @app.get('/flash')
+    def add_flash():
+        flash('Saved', 'success')
+        return 'ok'
+
+    return app, version
+
+
+def test_matching_etag_short_circuits_before_render():
+    renders = []
+    app, version = make_app(renders)
+    client = app.test_client()
+
+    first = client.get('/list')
+    etag = first.headers['ETag']
+    assert etag.startswith('W/')
+    assert first.headers['Cache-Control'] == 'private, no-cache'
+    assert first.last_modified is not None
+
+    again = client.get('/list', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b''
+    assert len(renders) == 1
+
+    # Other filters/cursors are other pages
+    assert client.get('/list?after=abc', headers={'If-None-Match': etag}).status_code == 200
+
+    version['n'] = 2
+    assert client.get('/list', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_pending_flash_forces_full_render():
+    renders = []
+    app, _ = make_app(renders)
+    client = app.test_client()
+    etag = client.get('/list').headers['ETag']
+
+    client.get('/flash')
+    resp = client.get('/list', headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+    assert 'ETag' not in resp.headers
@@ -0,0 +1,53 @@
+from app import counters
+
+
+def test_status_change_moves_counts_between_columns(monkeypatch):
+    calls = []
+    monkeypatch.setattr(counters, 'execute', lambda sql, params=(): calls.append(params))
+
+    before = {'teacher_id': 3, 'subject_id': 1, 'moderation_status': 'pending', 'is_read': 0}
+    counters.record_change(before, moderation_status='approved')
+    # teacher, subject, pending, approved, rejected, read, unread
+    assert calls == [(3, 1, -1, 1, 0, 0, 1)]
+
+
+def test_noop_changes_write_nothing(monkeypatch):
+    calls = []
+    monkeypatch.setattr(counters, 'execute', lambda sql, params=(): calls.append(params))
+
+    # Marking pending feedback read changes no counter column
+    before = {'teacher_id': 3, 'subject_id': 1, 'moderation_status': 'pending', 'is_read': 0}
+    counters.record_change(before, is_read=1)
+    assert calls == []
+
+    counters.apply([(3, 1, 'approved', 1, 2), (3, 2, 'rejected', 0, -1)])
+    assert calls == [(3, 1, 0, 2, 0, 2, 0), (3, 2, 0, 0, -1, 0, 0)]
+
+
+def test_bulk_status_chunks_update_counters_per_group(monkeypatch):
+    from contextlib import nullcontext
+    from app import routes
+    calls = []
+    monkeypatch.setattr(routes, 'MODERATION_BULK_CHUNK_SIZE', 2)
+    monkeypatch.setattr(routes, 'query_all', lambda sql, params=(): [
+        {'teacher_id': 3, 'subject_id': 1, 'moderation_status': 'pending', 'is_read': 0, 'n': len(params) - 1},
+    ])
+    monkeypatch.setattr(routes, 'execute_rowcount', lambda sql, params=(): len(params) - 2)
+    monkeypatch.setattr(counters, 'execute', lambda sql, params=(): calls.append(params))
+    monkeypatch.setattr(routes, 'transaction', nullcontext)
+
+    assert routes._bulk_set_moderation_status('approved', ids=[1, 2, 3]) == 3
+    # One UPDATE per chunk of two ids, each moving its rows from pending to approved/unread
+    assert calls == [(3, 1, -2, 2, 0, 0, 2), (3, 1, -1, 1, 0, 0, 1)]
+
+
+def test_rebuild_tells_other_processes(monkeypatch):
+    from contextlib import nullcontext
+    published = []
+    monkeypatch.setattr(counters, 'execute', lambda sql, params=(): None)
+    monkeypatch.setattr(counters, 'query_one', lambda sql, params=(): {'lo': 1, 'hi': 1, 'n': 2})
+    monkeypatch.setattr(counters, 'transaction', nullcontext)
+    monkeypatch.setattr(counters.invalidation.bus, 'publish', lambda kind, names: published.append((kind, names)))
+
+    assert counters.rebuild() == 2
+    assert published == [('table', {'feedback_counters'})]
@@ -0,0 +1,252 @@
+import threading
+import pytest
+from app import db
+from app.db import ConnectionPool, PoolExhausted
+
+
+class FakeCursor:
+    lastrowid = 1
+    rowcount = 1
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.closed = False
+
+    def execute(self, sql, params=()):
+        self.conn.statements.append(sql)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    def __init__(self, **kwargs):
+        self.closed = False
+        self.in_transaction = False
+        self.statements = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.connection_id = 1
+
+    def cursor(self, **kwargs):
+        return FakeCursor(self)
+
+    def start_transaction(self):
+        self.in_transaction = True
+
+    def commit(self):
+        self.commits += 1
+        self.in_transaction = False
+
+    def is_connected(self):
+        return not self.closed
+
+    def reconnect(self):
+        self.closed = False
+
+    def reset_session(self):
+        pass
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = True
+
+
+def make_pool(**overrides):
+    opts = dict(min_size=1, max_size=2, timeout=0.05, max_waiters=4, idle_timeout=300, connect=FakeConnection)
+    opts.update(overrides)
+    return ConnectionPool(**opts)
+
+
+def test_pool_grows_to_max_and_reuses_connections():
+    pool = make_pool()
+    pool.fill()
+    assert pool.stats()['size'] == 1
+
+    c1 = pool.get_connection()
+    c2 = pool.get_connection()
+    assert pool.stats()['in_use'] == 2
+
+    c1.close()
+    c3 = pool.get_connection()
+    assert c3 is c1
+    c2.close()
+    c3.close()
+    assert pool.stats()['idle'] == 2
+
+
+def test_pool_times_out_with_retry_after():
+    pool = make_pool(max_size=1)
+    held = pool.get_connection()
+    with pytest.raises(PoolExhausted) as exc:
+        pool.get_connection()
+    assert exc.value.retry_after > 0
+    assert pool.stats()['timeouts'] == 1
+    held.close()
+
+
+def test_pool_rejects_when_wait_queue_full():
+    pool = make_pool(max_size=1, max_waiters=0)
+    held = pool.get_connection()
+    with pytest.raises(PoolExhausted):
+        pool.get_connection()
+    assert pool.stats()['rejected'] == 1
+    held.close()
+
+
+def test_waiter_gets_released_connection():
+    pool = make_pool(max_size=1, timeout=2)
+    held = pool.get_connection()
+    got = []
+
+    def worker():
+        got.append(pool.get_connection())
+
+    t = threading.Thread(target=worker)
+    t.start()
+    held.close()
+    t.join(2)
+    assert got and got[0] is held
+    assert sum(pool.stats()['wait_histogram'].values()) == 2
+
+
+def test_idle_connections_shrink_to_min():
+    pool = make_pool(min_size=1, max_size=3, idle_timeout=0)
+    conns = [pool.get_connection() for _ in range(3)]
+    for c in conns:
+        c.close()
+    assert pool.stats()['size'] == 3
+    pool.get_connection().close()
+    assert pool.stats()['size'] == 1
+    assert conns[0]._raw.closed
+
+
+def test_transaction_commits_once_and_rolls_back_on_error(monkeypatch):
+    pool = make_pool(max_size=1)
+    monkeypatch.setattr(db.MySQLPool, '_pool', pool)
+
+    with db.transaction() as conn:
+        db.execute("INSERT INTO a VALUES (1)")
+        db.execute("INSERT INTO b VALUES (2)")
+    assert conn.commits == 1
+    assert len(conn.statements) == 2
+
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.execute("INSERT INTO a VALUES (3)")
+            raise RuntimeError("boom")
+    assert conn.commits == 1
+    assert conn.rollbacks == 1
+    assert pool.stats()['in_use'] == 0
+
+
+def test_prepared_statement_cache_is_lru_and_survives_reconnect(monkeypatch):
+    monkeypatch.setattr(db, 'DB_PREPARED_CACHE_SIZE', 2)
+    conn = make_pool().get_connection()
+
+    first = conn.execute_prepared("SELECT 1")
+    assert conn.execute_prepared("SELECT 1") is first
+    conn.execute_prepared("SELECT 2")
+    conn.execute_prepared("SELECT 3")
+    assert first.closed
+    assert list(conn._statements) == ["SELECT 2", "SELECT 3"]
+
+    # New server session: statements must be prepared again
+    stale = conn._statements["SELECT 3"][1]
+    conn._raw.connection_id = 2
+    assert conn.execute_prepared("SELECT 3") is not stale
+    assert list(conn._statements) == ["SELECT 3"]
+
+
+def test_reads_go_to_healthy_replica_and_writes_to_primary(monkeypatch):
+    primary = make_pool()
+    replica = db.Replica('replica:3306', make_pool())
+    replica.checked_at = float('inf')  # skip the lag probe
+    monkeypatch.setattr(db.MySQLPool, '_pool', primary)
+    monkeypatch.setattr(db.MySQLPool, '_replicas', [replica])
+
+    with db._connection(readonly=True) as conn:
+        assert conn._pool is replica.pool
+    with db._connection() as conn:
+        assert conn._pool is primary
+    with db.transaction():
+        with db._connection(readonly=True) as conn:
+            assert conn._pool is primary
+
+    replica.healthy = False
+    with db._connection(readonly=True) as conn:
+        assert conn._pool is primary
+
+
+def test_statement_shapes_and_nplus1_detection(monkeypatch):
+    from flask import Flask
+    monkeypatch.setattr(db.MySQLPool, '_pool', make_pool())
+    assert db.normalize_sql("SELECT *\n  FROM t WHERE a=5 AND b='x' AND c IN (%s, %s)") == \
+        "SELECT * FROM t WHERE a=? AND b=? AND c IN (...)"
+
+    with Flask(__name__).app_context():
+        for feedback_id in range(db.DB_NPLUS1_THRESHOLD):
+            db.execute("UPDATE feedback SET is_read=1 WHERE id=%s", (feedback_id,))
+        stats = db.request_db_stats()
+        db.close_connection()
+    assert stats['count'] == db.DB_NPLUS1_THRESHOLD
+    assert stats['repeated'] == [("UPDATE feedback SET is_read=? WHERE id=?", db.DB_NPLUS1_THRESHOLD)]
+
+
+def test_close_drops_idle_now_and_busy_connections_on_release():
+    pool = make_pool(min_size=2)
+    pool.fill()
+    busy = pool.get_connection()
+    idle = pool._idle[0]
+    pool.close()
+    assert idle._raw.closed and not busy._raw.closed
+    busy.close()
+    assert busy._raw.closed and pool.stats()['size'] == 0
+
+
+def test_forked_child_forgets_inherited_pools_without_closing_them(monkeypatch):
+    inherited = make_pool()
+    inherited.fill()
+    monkeypatch.setattr(db.MySQLPool, '_pool', inherited)
+    monkeypatch.setattr(db.MySQLPool, '_inherited', [])
+    monkeypatch.setattr(db, '_new_pool', lambda cfg: make_pool())
+
+    db.MySQLPool.reset_after_fork()
+    assert db.MySQLPool._pool is None
+    # The parent's sockets are left alone
+    assert not inherited._idle[0]._raw.closed
+
+    conn = db.MySQLPool.get_connection()
+    assert conn._pool is db.MySQLPool._pool is not inherited
+    conn.close()
+
+
+def test_statements_outside_transaction_autocommit(monkeypatch):
+    assert db._new_pool({'host': 'db'})._conn_kwargs['autocommit'] is True
+    pool = make_pool(max_size=1)
+    monkeypatch.setattr(db.MySQLPool, '_pool', pool)
+
+    db.execute("UPDATE a SET b=1")
+    raw = pool._idle[0]._raw
+    # No COMMIT round trip and no transaction left open between statements
+    assert raw.commits == 0 and not raw.in_transaction
+    with db.transaction() as conn:
+        assert conn._raw is raw and raw.in_transaction
+    assert raw.commits == 1 and not raw.in_transaction
+
+
+def test_mark_written_invalidates_on_commit(monkeypatch):
+    pool = make_pool(max_size=1)
+    monkeypatch.setattr(db.MySQLPool, '_pool', pool)
+    committed = []
+    monkeypatch.setattr(db, 'commit_listeners', [committed.append])
+
+    with db.transaction():
+        db.mark_written({'teachers'})
+        assert committed == []
+    assert committed == [{'teachers'}]
+    db.mark_written({'subjects'})
+    assert committed[-1] == {'subjects'}
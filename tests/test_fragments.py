@@ -0,0 +1,53 @@
+from flask import Flask
+from jinja2 import Environment
+from app import fragments
+from app.db import invalidate_tables
+
+
+def test_fragment_reused_until_a_dependency_is_written():
+    fragments.fragment_cache.clear()
+    env = Environment(extensions=[fragments.FragmentCacheExtension], autoescape=True)
+    tmpl = env.from_string(
+        "{% cache 'teachers', cls, depends=['teacher_classes'] %}"
+        "{% for t in teachers %}<li>{{ t }}</li>{% endfor %}"
+        "{% endcache %}"
+    )
+
+    assert tmpl.render(cls='1A', teachers=['<b>']) == '<li>&lt;b&gt;</li>'
+    # Same key and versions: the block is not rendered again
+    assert tmpl.render(cls='1A', teachers=['bob']) == '<li>&lt;b&gt;</li>'
+    assert tmpl.render(cls='2B', teachers=['bob']) == '<li>bob</li>'
+
+    invalidate_tables({'teacher_classes'})
+    assert tmpl.render(cls='1A', teachers=['bob']) == '<li>bob</li>'
+
+
+def test_fragment_keyed_on_versions_from_request_start_and_loads_lazily():
+    fragments.fragment_cache.clear()
+    app = Flask(__name__)
+    fragments.init_app(app)
+    tmpl = app.jinja_env.from_string(
+        "{% cache 'subjects', 1, depends=['feedback_counters'] %}"
+        "{% set rows = load() %}{{ rows|join(',') }}"
+        "{% endcache %}"
+    )
+    loads = []
+
+    def load(rows):
+        loads.append(rows)
+        return rows
+
+    with app.test_request_context():
+        app.preprocess_request()
+        # Data read after a write that landed mid-request is stored under the
+        # versions from before it, which the next request no longer asks for
+        invalidate_tables({'feedback_counters'})
+        assert tmpl.render(load=lambda: load(['new'])) == 'new'
+    with app.test_request_context():
+        app.preprocess_request()
+        assert tmpl.render(load=lambda: load(['newer'])) == 'newer'
+    with app.test_request_context():
+        app.preprocess_request()
+        # Cached: the loader is not called
+        assert tmpl.render(load=lambda: load(['unused'])) == 'newer'
+    assert loads == [['new'], ['newer']]
@@ -0,0 +1,62 @@
+from contextlib import nullcontext
+from app import invalidation
+from app.invalidation import InvalidationBus, LocalHub, LocalTransport, MySQLTransport
+
+
+def test_events_reach_other_processes_but_not_the_publisher():
+    hub = LocalHub()
+    worker_a = InvalidationBus(LocalTransport(hub), source=lambda: 'a')
+    worker_b = InvalidationBus(LocalTransport(hub), source=lambda: 'b')
+    seen = {'a': [], 'b': []}
+    worker_a.on('table', seen['a'].append)
+    worker_b.on('table', seen['b'].append)
+
+    worker_a.publish('table', {'subjects', 'teacher_subjects'})
+    worker_a.publish('table', {'subjects'})
+
+    assert worker_a.poll_once() == 0
+    # Repeated events for the same table are applied once per poll
+    assert worker_b.poll_once() == 2
+    assert sorted(seen['b']) == ['subjects', 'teacher_subjects']
+    assert seen['a'] == []
+    assert worker_b.poll_once() == 0
+
+
+def test_mysql_transport_follows_high_water_mark_and_rechecks_gaps(monkeypatch):
+    log = []
+
+    def fake_query_all(sql, params=()):
+        after, *gaps = params
+        return [r for r in log if r['id'] > after or r['id'] in gaps]
+
+    monkeypatch.setattr(invalidation, 'query_all', fake_query_all)
+    monkeypatch.setattr(invalidation, 'query_one', lambda sql, params=(): {'id': 4})
+    monkeypatch.setattr(invalidation, 'transaction', nullcontext)
+
+    transport = MySQLTransport(gap_timeout=60)
+    transport.sync()
+    log += [{'id': 4, 'origin': 'x', 'kind': 'table', 'name': 'old'},
+            {'id': 6, 'origin': 'x', 'kind': 'table', 'name': 'users'}]
+    assert transport.poll() == [('x', 'table', 'users')]
+    assert transport.high_water == 6
+
+    # id 5 was still uncommitted during the last poll
+    log.insert(1, {'id': 5, 'origin': 'y', 'kind': 'user', 'name': '7'})
+    assert transport.poll() == [('y', 'user', '7')]
+    assert transport.poll() == []
+
+
+def test_a_request_publishes_its_events_once_at_teardown(monkeypatch):
+    from flask import Flask
+    hub = LocalHub()
+    monkeypatch.setattr(invalidation, 'bus', InvalidationBus(LocalTransport(hub), source=lambda: 'a'))
+    other = LocalTransport(hub)
+
+    with Flask(__name__).app_context():
+        invalidation._publish_tables({'users', 'teachers'})
+        invalidation._publish_tables({'users', 'cache_invalidations'})
+        invalidation.publish('user', {'7'})
+        assert other.poll() == []
+        invalidation._flush()
+
+    assert sorted(other.poll()) == [('a', 'table', 'teachers'), ('a', 'table', 'users'), ('a', 'user', '7')]
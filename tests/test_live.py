@@ -0,0 +1,28 @@
+import threading
+from app.live import StreamSlots, ThreadWatcher
+
+
+def test_publish_wakes_waiting_stream_and_wait_times_out():
+    watcher = ThreadWatcher(poll_interval=3600)  # keep the poller asleep
+    with watcher.watch(1):
+        assert watcher.wait(1, 0, timeout=0.01) == 0
+
+        timer = threading.Timer(0.05, watcher.publish, args=(1, 7))
+        timer.start()
+        assert watcher.wait(1, 0, timeout=2) == 7
+        # Older ids never move the high-water mark back
+        watcher.publish(1, 3)
+        assert watcher.wait(1, 7, timeout=0.01) == 7
+    # Nothing is remembered for threads nobody watches
+    assert watcher.wait(1, 0, timeout=0.01) == 0
+    watcher.publish(2, 5)
+    assert watcher._latest == {}
+
+
+def test_stream_slots_refuse_above_the_limit():
+    slots = StreamSlots(limit=2)
+    assert slots.acquire() and slots.acquire()
+    assert not slots.acquire()
+    slots.release()
+    assert slots.acquire()
+    assert slots.stats() == {'open': 2, 'limit': 2, 'rejected': 1}
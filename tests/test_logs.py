@@ -0,0 +1,57 @@
+import logging
+import queue
+from app import logs
+from app.logs import DroppingQueueHandler, JsonFormatter, LockedRotatingFileHandler
+
+
+def make_record(msg, **fields):
+    record = logging.LogRecord('bzz.test', logging.INFO, __file__, 1, msg, (), None)
+    record.fields = fields
+    return record
+
+
+def test_full_queue_drops_and_counts_instead_of_blocking():
+    handler = DroppingQueueHandler(queue.Queue(2))
+    for i in range(5):
+        handler.handle(make_record(f'r{i}'))
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+
+
+def test_sampling_keeps_errors_and_slow_requests(monkeypatch):
+    monkeypatch.setattr(logs, '_sample_rates', logs.parse_sample_rates('routes.feedback_messages=0.1, assets.asset=0,bad'))
+    assert logs._sample_rates == {'routes.feedback_messages': 0.1, 'assets.asset': 0.0}
+    assert logs.sample_rate('routes.feedback_messages', 200, 5) == 0.1
+    assert logs.sample_rate('routes.feedback_messages', 500, 5) == 1.0
+    assert logs.sample_rate('assets.asset', 200, logs.SLOW_REQUEST_MS) == 1.0
+    assert logs.sample_rate('routes.dashboard', 200, 5) == 1.0
+
+
+def test_processes_sharing_a_file_follow_each_others_rotation(tmp_path):
+    path = str(tmp_path / 'info.log')
+    # Two handlers on one file stand in for two worker processes
+    first, second = (LockedRotatingFileHandler(path, maxBytes=200, backupCount=50) for _ in range(2))
+    for handler in (first, second):
+        handler.setFormatter(JsonFormatter())
+    for i in range(40):
+        (first if i % 2 else second).handle(make_record('request', n=i))
+    first.close()
+    second.close()
+
+    lines = []
+    for file in tmp_path.glob('info.log*'):
+        if not file.name.endswith('.lock'):
+            lines += file.read_text().splitlines()
+    assert len(lines) == 40
+    assert '"n": 39' in (tmp_path / 'info.log').read_text()
+
+
+def test_app_loggers_under_bzz_reach_the_queue(monkeypatch):
+    logs._setup_handlers()
+    queued = []
+    monkeypatch.setattr(logs._queue_handler, 'enqueue', queued.append)
+    logging.getLogger('bzz.invalidation').error('poll failed')
+    logging.getLogger('bzz.warmup').info('warm-up done')
+    logging.getLogger('bzz.slow_query').warning('slow query')
+    # Each handled once, by the handler on the parent
+    assert [r.name for r in queued] == ['bzz.invalidation', 'bzz.warmup', 'bzz.slow_query']
@@ -0,0 +1,90 @@
+from flask import Flask
+from app import metrics
+
+
+def snapshot(pid, requests, in_use, durations):
+    registry = metrics.Registry()
+    for _ in range(requests):
+        registry.inc('bzz_http_requests_total', {'endpoint': 'routes.dashboard', 'method': 'GET', 'status': '200'})
+    for seconds in durations:
+        registry.observe('bzz_http_request_duration_seconds', {'endpoint': 'routes.dashboard'}, seconds)
+    return {'pid': pid, **registry.samples(),
+            'gauges': [['bzz_db_pool_connections', {'pool': 'primary', 'state': 'in_use'}, in_use]]}
+
+
+def test_merge_sums_all_workers_but_gauges_only_of_live_ones(monkeypatch):
+    monkeypatch.setattr(metrics, '_alive', lambda pid: pid == 1)
+    merged = metrics.merge([snapshot(1, 3, 2, [0.004, 0.2]), snapshot(2, 4, 5, [0.2, 30])])
+    text = metrics.render(merged)
+
+    assert '# TYPE bzz_http_requests_total counter' in text
+    assert 'bzz_http_requests_total{endpoint="routes.dashboard",method="GET",status="200"} 7' in text
+    assert 'bzz_db_pool_connections{pool="primary",state="in_use"} 2' in text
+    assert 'bzz_http_request_duration_seconds_bucket{endpoint="routes.dashboard",le="0.005"} 1' in text
+    assert 'bzz_http_request_duration_seconds_bucket{endpoint="routes.dashboard",le="0.25"} 3' in text
+    assert 'bzz_http_request_duration_seconds_bucket{endpoint="routes.dashboard",le="+Inf"} 4' in text
+    assert 'bzz_http_request_duration_seconds_count{endpoint="routes.dashboard"} 4' in text
+    assert 'bzz_http_request_duration_seconds_sum{endpoint="routes.dashboard"} 30.404' in text
+
+
+def test_snapshots_written_by_each_process_are_read_back(tmp_path, monkeypatch):
+    metrics.registry.inc('bzz_http_requests_total', {'endpoint': 'x', 'method': 'GET', 'status': '200'})
+    metrics.flush(str(tmp_path))
+    (tmp_path / '999999.json').write_text('{"pid": 999999, "counters": [["bzz_refdata_loads_total", {}, 2]]')
+    snapshots = metrics._snapshots(str(tmp_path))
+    # The truncated file is skipped, our own is refreshed on the way
+    assert [s['pid'] for s in snapshots] == [metrics.os.getpid()]
+
+
+def test_endpoint_counts_requests_and_is_internal_only():
+    app = Flask(__name__)
+    metrics.init_app(app)
+    app.add_url_rule('/hello', 'hello', lambda: 'hi')
+    client = app.test_client()
+    client.get('/hello')
+    client.get('/nope')
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    body = response.get_data(as_text=True)
+    assert 'bzz_http_requests_total{endpoint="hello",method="GET",status="200"}' in body
+    assert 'bzz_http_requests_total{endpoint="unmatched",method="GET",status="404"}' in body
+    assert 'bzz_cache_hits_total{cache="principal"}' in body
+
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '203.0.113.7'}).status_code == 404
+
+
+def test_authorization(monkeypatch):
+    app = Flask(__name__)
+    metrics.init_app(app)
+    client = app.test_client()
+    # Behind a reverse proxy remote_addr is the proxy's, so proxied requests are refused
+    assert client.get('/metrics', headers={'X-Forwarded-For': '203.0.113.7'}).status_code == 404
+
+    monkeypatch.setattr(metrics, 'METRICS_TOKEN', 's3cret')
+    assert client.get('/metrics').status_code == 404
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 404
+    ok = client.get('/metrics', headers={'Authorization': 'Bearer s3cret', 'X-Forwarded-For': '203.0.113.7'},
+                    environ_base={'REMOTE_ADDR': '203.0.113.8'})
+    assert ok.status_code == 200
+
+
+def test_refused_scrape_is_a_404_in_the_full_app(offline_app):
+    client = offline_app.test_client()
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '203.0.113.7'}).status_code == 404
+
+
+def test_retired_workers_are_folded_into_one_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, '_alive', lambda pid: True)
+    for pid, requests in ((101, 3), (102, 4)):
+        (tmp_path / f'{pid}.json').write_text(metrics.json.dumps(snapshot(pid, requests, 1, [0.2])))
+        metrics.retire(pid, str(tmp_path))
+    metrics.retire(103, str(tmp_path))  # never wrote a snapshot
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == [metrics.RETIRED]
+    text = metrics.render(metrics.merge(metrics._snapshots(str(tmp_path))))
+    assert 'bzz_http_requests_total{endpoint="routes.dashboard",method="GET",status="200"} 7' in text
+    assert 'bzz_http_request_duration_seconds_count{endpoint="routes.dashboard"} 2' in text
+    # Only our own process's pool is reported; the retired ones are gone
+    assert 'bzz_db_pool_connections{pool="primary",state="in_use"} 1' not in text
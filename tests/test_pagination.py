@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+from app import pagination
+
+
+def test_cursor_round_trip_and_malformed_tokens():
+    row = {'created_at': datetime(2025, 3, 1, 12, 30), 'id': 17}
+    assert pagination.decode_cursor(pagination.encode_cursor(row)) == (row['created_at'], 17)
+    assert pagination.decode_cursor(None) is None
+    assert pagination.decode_cursor('not-a-cursor') is None
+
+
+def test_fetch_page_walks_forward_and_back(monkeypatch):
+    base = datetime(2025, 1, 1)
+    rows = [{'id': i, 'created_at': base + timedelta(minutes=i)} for i in range(1, 6)]
+
+    def fake_query_all(sql, params):
+        # Emulate the keyset bound and ordering fetch_page appends
+        limit = params[-1]
+        result = sorted(rows, key=lambda r: (r['created_at'], r['id']), reverse='DESC' in sql)
+        if len(params) > 1:
+            key = (params[0], params[2])
+            newer = '>' in sql.split('ORDER BY')[0]
+            result = [r for r in result if ((r['created_at'], r['id']) > key) == newer
+                      and (r['created_at'], r['id']) != key]
+        return [dict(r) for r in result[:limit]]
+
+    monkeypatch.setattr(pagination, 'query_all', fake_query_all)
+    first = pagination.fetch_page("SELECT * FROM feedback f WHERE 1=1", (), page_size=2)
+    assert [r['id'] for r in first.rows] == [5, 4]
+    assert first.prev_cursor is None
+
+    second = pagination.fetch_page("SELECT * FROM feedback f WHERE 1=1", (), after=first.next_cursor, page_size=2)
+    assert [r['id'] for r in second.rows] == [3, 2]
+
+    back = pagination.fetch_page("SELECT * FROM feedback f WHERE 1=1", (), before=second.prev_cursor, page_size=2)
+    assert [r['id'] for r in back.rows] == [5, 4]
+    assert back.prev_cursor is None
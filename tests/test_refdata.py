@@ -0,0 +1,53 @@
+from contextlib import nullcontext
+from app import refdata
+from app.db import invalidate_tables
+
+
+def test_snapshot_indexes_and_reload_on_version_change(monkeypatch):
+    tables = {
+        'subjects': [{'id': 2, 'name': 'Biology'}, {'id': 1, 'name': 'Math'}],
+        'feedback_categories': [{'id': 9, 'name': 'Pace'}],
+        'teachers': [{'id': 5, 'username': 'alice'}, {'id': 3, 'username': 'bob'}],
+        'teacher_subjects': [{'teacher_id': 3, 'subject_id': 1}, {'teacher_id': 3, 'subject_id': 2}],
+        'teacher_classes': [{'teacher_id': 3, 'class_name': '1A'}, {'teacher_id': 5, 'class_name': '1A'}],
+    }
+    loads = []
+
+    def fake_query_all(sql, params=()):
+        name = 'teachers' if 'FROM teachers' in sql else sql.split('FROM ')[1].split()[0]
+        loads.append(name)
+        return tables[name]
+
+    monkeypatch.setattr(refdata, 'query_all', fake_query_all)
+    monkeypatch.setattr(refdata, 'transaction', nullcontext)
+    monkeypatch.setattr(refdata, '_snapshot', None)
+
+    ref = refdata.current()
+    assert ref.teachers_for_class('1A') == [{'id': 5, 'username': 'alice'}, {'id': 3, 'username': 'bob'}]
+    assert ref.teachers_for_class(None) == ref.teachers_for_class('1A')
+    assert ref.teachers_for_class('9Z') == []
+    assert [s['name'] for s in ref.subjects_for_teacher(3)] == ['Biology', 'Math']
+    assert ref.global_categories() == [{'id': 9, 'name': 'Pace'}]
+    assert ref.teacher_name(7) is None
+
+    assert refdata.current() is ref
+    assert len(loads) == 5
+
+    tables['teacher_classes'] = [{'teacher_id': 3, 'class_name': '1A'}]
+    invalidate_tables({'teacher_classes'})
+    assert refdata.current().teachers_for_class('1A') == [{'id': 3, 'username': 'bob'}]
+    assert len(loads) == 10
+
+
+def test_unrelated_writes_keep_the_snapshot(monkeypatch):
+    loads = []
+    monkeypatch.setattr(refdata, 'query_all', lambda sql, params=(): loads.append(sql) or [])
+    monkeypatch.setattr(refdata, 'transaction', nullcontext)
+    monkeypatch.setattr(refdata, '_snapshot', None)
+
+    ref = refdata.current()
+    # Logins re-hash passwords, teachers add per-subject categories
+    invalidate_tables({'users', 'feedback_categories', 'feedback'})
+    assert refdata.current() is ref
+    invalidate_tables({'teachers'})
+    assert refdata.current() is not ref
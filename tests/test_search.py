@@ -0,0 +1,37 @@
+from app import search
+
+
+class Principal:
+    def __init__(self, role, user_id=1, teacher_id=None):
+        self.role, self.id, self.teacher_id = role, user_id, teacher_id
+
+
+def test_boolean_query_requires_every_word_as_prefix():
+    assert search.boolean_query('Homework  too-long!') == '+Homework* +too* +long*'
+    assert search.boolean_query('+"" -*') == ''
+
+
+def test_search_scoped_by_role(monkeypatch):
+    calls = []
+    monkeypatch.setattr(search, 'query_all', lambda sql, params: calls.append((sql, params)) or [])
+
+    search.search_feedback(Principal('teacher', teacher_id=7), 'exam', page=2, page_size=10)
+    sql, params = calls.pop()
+    # The scope is applied inside both MATCH branches, each bounded on its own
+    assert sql.count("f.teacher_id=%s AND f.moderation_status='approved'") == 2
+    assert 'feedback_messages' in sql
+    branch = ('+exam*', '+exam*', 7, 10 * search.SEARCH_MAX_PAGES + 1)
+    assert params == branch * 2 + (11, 10)
+
+    search.search_feedback(Principal('student', user_id=5), 'exam')
+    sql, params = calls.pop()
+    assert sql.count('f.student_id=%s') == 2
+    assert params[2] == params[6] == 5
+
+    search.search_feedback(Principal('admin'), 'exam')
+    assert 'feedback_messages' not in calls.pop()[0]
+
+    # Teachers without a profile and empty queries never hit the database
+    assert search.search_feedback(Principal('teacher'), 'exam') == ([], False)
+    assert search.search_feedback(Principal('student'), '!!') == ([], False)
+    assert calls == []
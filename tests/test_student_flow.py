@@ -60,3 +60,27 @@ def test_student_dashboard_and_submit_feedback(client):
     assert b'Waiting for validation' in resp.data
 
 
+def test_thread_messages_posted_and_fetched_incrementally(client):
+    from app.db import execute, query_one
+    client.post('/logout', follow_redirects=True)
+    client.post('/register', data={'username': 'stud_thread', 'password': 'Passw0rd!', 'password2': 'Passw0rd!',
+                                   'class_name': 'Grade 9A'})
+    teacher = query_one("SELECT id FROM teachers LIMIT 1")
+    if not teacher:
+        pytest.skip("No teachers available for testing")
+    student = query_one("SELECT id FROM users WHERE username='stud_thread'")
+    assert student is not None, "registration did not create the student"
+    feedback_id = execute(
+        "INSERT INTO feedback (student_id, teacher_id, subject_id, title, info) VALUES (%s, %s, 1, 'Thread', 'x')",
+        (student['id'], teacher['id']),
+    )
+
+    resp = client.post(f'/feedback/{feedback_id}/thread', data={'message': 'first'},
+                       headers={'Accept': 'application/json'})
+    assert resp.status_code == 201
+    first_id = resp.get_json()['id']
+    client.post(f'/feedback/{feedback_id}/thread', data={'message': 'second'}, headers={'Accept': 'application/json'})
+
+    data = client.get(f'/feedback/{feedback_id}/messages?after={first_id}').get_json()
+    assert [m['message'] for m in data['messages']] == ['second']
+    assert data['messages'][0]['sender_name'] == 'Student'
@@ -38,3 +38,27 @@ def test_teacher_subject_overview_and_filter(client):
         assert b'Your feedback' in resp3.data or b'No feedback' in resp3.data
 
 
+def test_teacher_bulk_mark_read(client):
+    from app.db import query_one
+    execute("UPDATE users SET role='teacher' WHERE username='alice'")
+    if not query_one("SELECT id FROM teachers WHERE user_id = (SELECT id FROM users WHERE username='alice')"):
+        execute("INSERT INTO teachers (user_id) SELECT id FROM users WHERE username='alice'")
+    teacher_id = query_one("SELECT id FROM teachers WHERE user_id = (SELECT id FROM users WHERE username='alice')")['id']
+    ids = [
+        execute(
+            "INSERT INTO feedback (teacher_id, subject_id, title, info, moderation_status) VALUES (%s, 1, %s, 'x', 'approved')",
+            (teacher_id, f'bulk {i}'),
+        )
+        for i in range(3)
+    ]
+    login(client, 'alice', 'Password123!')
+
+    resp = client.post('/teacher/feedback/mark-read', data={'subject_id': 1, 'feedback_ids': ids[:2]})
+    assert resp.status_code == 302
+    assert 'subject_id=1' in resp.headers['Location']
+    assert query_one("SELECT SUM(is_read) AS n FROM feedback WHERE id IN (%s, %s, %s)", tuple(ids))['n'] == 2
+
+    from app.pagination import encode_cursor
+    newest = query_one("SELECT id, created_at FROM feedback WHERE id=%s", (ids[2],))
+    client.post('/teacher/feedback/mark-read', data={'subject_id': 1, 'scope': 'all', 'upto': encode_cursor(newest)})
+    assert query_one("SELECT is_read FROM feedback WHERE id=%s", (ids[2],))['is_read'] == 1
@@ -0,0 +1,42 @@
+from flask import Flask
+from jinja2 import DictLoader
+from app import warmup
+
+
+def test_warm_up_runs_every_step_and_survives_failures(monkeypatch):
+    calls = []
+    app = Flask(__name__)
+    app.jinja_loader = DictLoader({'a.html': '{{ x }}', 'b.html': '{% if y %}y{% endif %}'})
+
+    def pool_down():
+        calls.append('pool')
+        raise ConnectionError('database not up yet')
+
+    monkeypatch.setattr(warmup.MySQLPool, 'init_pool', pool_down)
+    monkeypatch.setattr(warmup.bus, 'sync', lambda: calls.append('invalidation'))
+    monkeypatch.setattr(warmup.bus, '_synced', False)
+    monkeypatch.setattr(warmup.refdata, 'current', lambda: calls.append('refdata'))
+    monkeypatch.setattr(warmup, 'needs_rehash', lambda h: calls.append('password_hash'))
+
+    timings = warmup.warm_up(app)
+
+    assert calls == ['pool', 'invalidation', 'refdata', 'password_hash']
+    assert list(timings) == ['templates', 'pool', 'invalidation', 'refdata', 'password_hash']
+    assert len(app.jinja_env.cache) == 2
+
+    calls.clear()
+    warmup.warm_up(app, connections=False)
+    assert 'pool' not in calls
+
+
+def test_forked_worker_keeps_the_masters_invalidation_position(monkeypatch):
+    calls = []
+    monkeypatch.setattr(warmup.bus, 'sync', lambda: calls.append('sync'))
+    monkeypatch.setattr(warmup.refdata, 'current', lambda: None)
+    monkeypatch.setattr(warmup, 'needs_rehash', lambda h: None)
+    # Synced by the master's warm-up before the fork: re-syncing would skip
+    # what was published between that warm-up and this worker starting
+    monkeypatch.setattr(warmup.bus, '_synced', True)
+
+    warmup.warm_up(Flask(__name__), connections=False)
+    assert calls == []
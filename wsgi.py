@@ -0,0 +1,5 @@
+from app.main import create_app
+
+
+# WSGI entry point for gunicorn (wsgi:app)
+app = create_app()